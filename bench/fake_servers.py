@@ -0,0 +1,380 @@
+"""Локальные заглушки внешних API для бенчмарков и воспроизведения трафика.
+
+FakeProxy отвечает как bazarishauto-proxy (/api/nav, /api/catalog) по
+синтетическому каталогу, FakeEncar — как api.encar.com/v1/readside/vehicle,
+FakeTelegram — как Telegram Bot API и запоминает, что бот отправил в каждый чат.
+У всех заглушек настраивается задержка ответа.
+"""
+
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_FACET_RE = {
+    field: re.compile(rf"{field}\.(.*?)\.(?:_\.|\))")
+    for field in ("Manufacturer", "ModelGroup", "Model", "BadgeGroup")
+}
+
+
+class FakeServer:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parts = urlsplit(self.path)
+                query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+                with fake._lock:
+                    fake.requests += 1
+                fake.sleep()
+                status, payload, headers = fake.handle(
+                    self.command, parts.path, query, body, self.headers
+                )
+                if payload is None:
+                    data = b""
+                elif isinstance(payload, bytes):
+                    data = payload
+                else:
+                    data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def sleep(self):
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def handle(self, method, path, query, body, headers):
+        raise NotImplementedError
+
+
+def build_catalog(brands=40, models=8, generations=3, trims=4):
+    """Синтетическое дерево каталога: {марка: {группа: {модель: [комплектации]}}}."""
+    catalog = {}
+    for b in range(brands):
+        brand = (f"브랜드{b}", f"Brand{b:02d}")
+        catalog[brand] = {}
+        for m in range(models):
+            group = (f"모델{b}-{m}", f"Model {b}-{m}")
+            catalog[brand][group] = {}
+            for g in range(generations):
+                generation = (f"모델{b}-{m} (G{g})", f"Model {b}-{m} (G{g})")
+                catalog[brand][group][generation] = [
+                    (f"가솔린 {t}WD", f"Gasoline {t}WD") for t in range(trims)
+                ]
+    return catalog
+
+
+def _facet(names, selected=False, children=None, metadata=None):
+    kr_name, eng_name = names
+    facet = {
+        "Value": kr_name,
+        "DisplayValue": kr_name,
+        "IsSelected": selected,
+        "Count": 100,
+        "Metadata": {"EngName": [eng_name], **(metadata or {})},
+    }
+    if children is not None:
+        facet["Refinements"] = {"Nodes": [{"Facets": children}]}
+    return facet
+
+
+class FakeProxy(FakeServer):
+    def __init__(self, catalog=None, listings_per_query=20, new_rate=0.1, **kwargs):
+        super().__init__(**kwargs)
+        self.catalog = catalog or build_catalog()
+        self.listings_per_query = listings_per_query
+        self.new_rate = new_rate
+        self.nav_requests = 0
+        self.catalog_requests = 0
+        # Объявлений отдано в ответах 200 — для сравнения с разобранными
+        self.listings_served = 0
+        self._ids = itertools.count(10_000_000)
+        self._results = {}
+
+    def handle(self, method, path, query, body, headers):
+        q = query.get("q", "")
+        if path == "/api/nav":
+            with self._lock:
+                self.nav_requests += 1
+            return 200, self._nav(q), None
+        if path == "/api/catalog":
+            with self._lock:
+                self.catalog_requests += 1
+            results = self._catalog(q)
+            total = len(results)
+            # Страница выдачи, как sr=|ModifiedDate|offset|count у прокси
+            sort = query.get("sr", "").split("|")
+            if len(sort) == 4:
+                offset, count = int(sort[2]), int(sort[3])
+                results = results[offset : offset + count]
+            # Валидатор как у настоящего прокси: не изменилось — 304 без тела
+            etag = '"%08x"' % zlib.crc32(",".join(r["Id"] for r in results).encode())
+            if headers.get("If-None-Match") == etag:
+                return 304, None, {"ETag": etag}
+            with self._lock:
+                self.listings_served += len(results)
+            return (
+                200,
+                {"Count": total, "SearchResults": results},
+                {"ETag": etag},
+            )
+        return 404, {"error": "not found"}, None
+
+    def _selected(self, q):
+        # Несколько значений бывают только у BadgeGroup — в группе (Or.…)
+        return {
+            field: values if field == "BadgeGroup" else values[0]
+            for field, regex in _FACET_RE.items()
+            if (values := regex.findall(q))
+        }
+
+    def _nav(self, q):
+        selected = self._selected(q)
+        facets = []
+        for brand, groups in self.catalog.items():
+            children = None
+            if brand[0] == selected.get("Manufacturer"):
+                children = []
+                for group, generations in groups.items():
+                    group_children = None
+                    if group[0] == selected.get("ModelGroup"):
+                        group_children = []
+                        for generation, trims in generations.items():
+                            trim_facets = None
+                            if generation[0] == selected.get("Model"):
+                                trim_facets = [_facet(trim) for trim in trims]
+                            group_children.append(
+                                _facet(
+                                    generation,
+                                    trim_facets is not None,
+                                    trim_facets,
+                                    {
+                                        "ModelStartDate": ["201801"],
+                                        "ModelEndDate": [""],
+                                    },
+                                )
+                            )
+                    children.append(
+                        _facet(group, group_children is not None, group_children)
+                    )
+            facets.append(_facet(brand, children is not None, children))
+
+        car_type = {"Facets": [{"Refinements": {"Nodes": [{"Facets": facets}]}}]}
+        # Запрос комплектаций идёт без SellType, и дерево марок в нём второе, а не третье
+        nodes = [{}, car_type] if "SellType" not in q else [{}, {}, car_type]
+        return {"iNav": {"Nodes": nodes}}
+
+    def _catalog(self, q):
+        selected = self._selected(q)
+        with self._lock:
+            results = self._results.setdefault(q, [])
+            if not results:
+                fresh = self.listings_per_query
+            elif self.new_rate:
+                fresh = max(1, int(self.listings_per_query * self.new_rate))
+            else:
+                fresh = 0
+            for _ in range(fresh):
+                results.insert(0, self._listing(next(self._ids), selected))
+            del results[self.listings_per_query :]
+            return list(results)
+
+    @staticmethod
+    def _listing(car_id, selected):
+        year = random.randint(2018, 2025)
+        return {
+            "Id": str(car_id),
+            "Manufacturer": selected.get("Manufacturer", ""),
+            "Model": selected.get("Model", ""),
+            "Badge": random.choice(selected.get("BadgeGroup") or [""]),
+            "BadgeDetail": "",
+            "FuelType": "가솔린",
+            "Price": random.randint(1000, 6000),
+            "Mileage": random.randint(0, 200_000),
+            "FormYear": str(year),
+            "Year": float(f"{year}01"),
+            "ModifiedDate": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+class FakeEncar(FakeServer):
+    def handle(self, method, path, query, body, headers):
+        if path.startswith("/v1/readside/vehicle/"):
+            car_id = path.rsplit("/", 1)[-1]
+            return (
+                200,
+                {
+                    "vehicleId": car_id,
+                    "spec": {"displacement": 2497},
+                    "manage": {"firstAdvertisedDateTime": "2024-01-02T10:00:00"},
+                },
+                None,
+            )
+        return 404, {"error": "not found"}, None
+
+
+class ReplayUpstream(FakeServer):
+    """Отдаёт записанные ответы прокси и Encar по пути и query запроса. Повторные
+    запросы получают следующие ответы из записи, после последнего — его же."""
+
+    def __init__(self, records=(), **kwargs):
+        super().__init__(**kwargs)
+        self.responses = {}
+        self.misses = 0
+        self._positions = {}
+        for record in records:
+            self.responses.setdefault(self.url_key(record["url"]), []).append(
+                (record["s"], record["b"].encode("utf-8"))
+            )
+
+    @staticmethod
+    def key(path, query):
+        return path, tuple(sorted(query.items()))
+
+    @classmethod
+    def url_key(cls, url):
+        parts = urlsplit(url)
+        return cls.key(parts.path, {k: v[-1] for k, v in parse_qs(parts.query).items()})
+
+    def handle(self, method, path, query, body, headers):
+        return self.lookup(self.key(path, query))
+
+    def lookup(self, key):
+        with self._lock:
+            recorded = self.responses.get(key)
+            if not recorded:
+                self.misses += 1
+                return 404, {"error": "not recorded"}, None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        status, body = recorded[min(position, len(recorded) - 1)]
+        return status, body, None
+
+
+class FakeTelegram(FakeServer):
+    """Bot API: запоминает последнее сообщение и клавиатуру в каждом чате
+    и позволяет дождаться ответа бота в чат."""
+
+    MESSAGE_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup"}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = {}
+        self.last_text = {}
+        self.last_markup = {}
+        self._message_ids = itertools.count(1)
+        self._replies = {}
+        self._changed = threading.Condition(self._lock)
+        # Чаты, заблокировавшие бота: отправка в них отвечает 403
+        self.blocked = set()
+
+    def handle(self, method, path, query, body, headers):
+        api_method = path.rsplit("/", 1)[-1]
+        params = dict(query)
+        if body and "json" not in (headers.get("Content-Type") or ""):
+            params.update({k: v[-1] for k, v in parse_qs(body.decode("utf-8")).items()})
+
+        with self._changed:
+            self.calls[api_method] = self.calls.get(api_method, 0) + 1
+            if int(params.get("chat_id") or 0) in self.blocked:
+                return (
+                    403,
+                    {
+                        "ok": False,
+                        "error_code": 403,
+                        "description": "Forbidden: bot was blocked by the user",
+                    },
+                    None,
+                )
+            if api_method in self.MESSAGE_METHODS:
+                result = self._message(api_method, params)
+            elif api_method == "getMe":
+                result = {
+                    "id": 1,
+                    "is_bot": True,
+                    "first_name": "bench",
+                    "username": "bench_bot",
+                }
+            elif api_method == "getUpdates":
+                result = []
+            else:
+                result = True
+            self._changed.notify_all()
+        return 200, {"ok": True, "result": result}, None
+
+    def _message(self, api_method, params):
+        chat_id = int(params.get("chat_id") or 0)
+        if "text" in params:
+            self.last_text[chat_id] = params["text"]
+        if "reply_markup" in params:
+            self.last_markup[chat_id] = json.loads(params["reply_markup"])
+        self._replies[chat_id] = self._replies.get(chat_id, 0) + 1
+        message_id = int(params.get("message_id") or next(self._message_ids))
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": self.last_text.get(chat_id, ""),
+        }
+
+    def replies(self, chat_id):
+        with self._lock:
+            return self._replies.get(chat_id, 0)
+
+    def wait_reply(self, chat_id, seen, timeout=30.0):
+        """Ждёт, пока бот отправит или изменит сообщение в чате после `seen` ответов."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self._replies.get(chat_id, 0) <= seen:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
+
+    def buttons(self, chat_id):
+        markup = self.last_markup.get(chat_id) or {}
+        return [button for row in markup.get("inline_keyboard", []) for button in row]
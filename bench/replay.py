@@ -0,0 +1,157 @@
+"""Воспроизведение записанного трафика на локальных заглушках.
+
+    CAPTURE_FILE=capture.jsonl.gz python main.py          # запись в проде
+    python -m bench.replay capture.jsonl.gz --speed 10   # воспроизведение
+
+Обновления подаются в bot.process_new_updates с исходными интервалами,
+ускоренными в --speed раз; прокси и Encar отвечают записанными ответами,
+подписки из снимка на момент начала записи запускаются заново.
+"""
+
+import argparse
+import json
+import resource
+import tempfile
+import threading
+import time
+
+from bench.fake_servers import FakeTelegram, ReplayUpstream
+from bench.run import import_bot, sample_threads, summary
+from capture import read_capture
+
+
+def load(path):
+    meta, updates, upstream, subscriptions = {}, [], [], {}
+    for record in read_capture(path):
+        kind = record["k"]
+        if kind == "meta" and not meta:
+            meta = record
+        elif kind == "update":
+            updates.append((record["t"], record["d"]))
+        elif kind == "upstream":
+            upstream.append(record)
+        elif kind == "subscriptions" and not subscriptions:
+            subscriptions = record["d"]
+    return meta, updates, upstream, subscriptions
+
+
+def senders(updates):
+    ids = set()
+    for _, update in updates:
+        for key, value in update.items():
+            if isinstance(value, dict) and "from" in value:
+                ids.add(value["from"]["id"])
+    return ids
+
+
+def run(args):
+    meta, updates, upstream, subscriptions = load(args.capture)
+    if not updates and not subscriptions:
+        raise SystemExit(f"В {args.capture} нет обновлений и подписок")
+
+    replay = ReplayUpstream(upstream, latency_ms=args.latency_ms).start()
+    telegram = FakeTelegram(latency_ms=args.telegram_latency_ms).start()
+    poll_interval = meta.get("poll_interval", 300) / args.speed
+    workdir = tempfile.mkdtemp(prefix="kga-replay-")
+    main = import_bot(replay.url, replay.url, telegram, poll_interval, workdir)
+    main.ACCESS = senders(updates) | {int(user_id) for user_id in subscriptions}
+
+    from telebot import types
+
+    stop = threading.Event()
+    peak_threads = [threading.active_count()]
+    threading.Thread(
+        target=sample_threads, args=(stop, peak_threads), daemon=True
+    ).start()
+
+    started = time.monotonic()
+    for user_id, searches in subscriptions.items():
+        for search in searches:
+            main.add_search_request(int(user_id), int(user_id), search)
+
+    lags = []
+    for offset, update in updates:
+        delay = started + offset / args.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            lags.append(-delay)
+        main.bot.process_new_updates([types.Update.de_json(update)])
+
+    # Даём опросу каталога доиграть записанный отрезок до конца
+    captured = max([offset for offset, _ in updates] + [r["t"] for r in upstream])
+    remaining = started + captured / args.speed + args.tail - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+    elapsed = time.monotonic() - started
+    stop.set()
+
+    return {
+        "capture": args.capture,
+        "speed": args.speed,
+        "captured_s": round(captured, 1),
+        "elapsed_s": round(elapsed, 2),
+        "updates": len(updates),
+        "updates_per_s": round(len(updates) / elapsed, 1),
+        "feed_lag": summary(lags),
+        "subscriptions": sum(len(searches) for searches in subscriptions.values()),
+        "upstream_recorded": len(upstream),
+        "upstream_served": replay.requests,
+        "upstream_misses": replay.misses,
+        "telegram_calls": dict(telegram.calls),
+        "routes": main.router.stats_snapshot(),
+        "peak_threads": peak_threads[0],
+        "max_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def print_report(report):
+    print(
+        f"=== {report['capture']}: ×{report['speed']:g}, "
+        f"{report['captured_s']} с записи за {report['elapsed_s']} с ==="
+    )
+    lag = report["feed_lag"]
+    print(
+        f"обновлений {report['updates']} ({report['updates_per_s']}/с), "
+        f"опозданий подачи {lag['count']}, p99 {lag['p99_ms']} мс"
+    )
+    print(
+        f"подписок {report['subscriptions']}, ответов API записано "
+        f"{report['upstream_recorded']}, отдано {report['upstream_served']}, "
+        f"нет в записи {report['upstream_misses']}"
+    )
+    print(f"вызовы Telegram: {report['telegram_calls']}")
+    print(f"{'кнопка':<18}{'n':>6}{'ошибок':>8}{'avg, мс':>10}{'max, мс':>10}")
+    for action, stats in report["routes"].items():
+        if stats["count"]:
+            print(
+                f"{action:<18}{stats['count']:>6}{stats['errors']:>8}"
+                f"{stats['avg_ms']:>10}{stats['max_ms']:>10}"
+            )
+    print(f"пик потоков: {report['peak_threads']}, max RSS: {report['max_rss_mb']} МБ")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("capture", help="файл, записанный с CAPTURE_FILE")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="ускорение: 1, 10, 100"
+    )
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30.0)
+    parser.add_argument(
+        "--tail", type=float, default=5.0, help="секунд после конца записи"
+    )
+    parser.add_argument("--json", help="сохранить отчёт в JSON-файл")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
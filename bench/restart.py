@@ -0,0 +1,102 @@
+"""Проверка запуска с сохранёнными запросами.
+
+    python -m bench.restart --subscriptions 20
+
+Перед импортом бота в рабочий каталог кладётся requests.json, как после
+перезапуска. Бот загружает его так же, как в __main__, и проверка падает,
+если не каждая сохранённая подписка попала в опрос или если за --duration
+секунд подписчикам не ушло ни одного уведомления.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench.fake_servers import FakeEncar, FakeProxy, FakeTelegram, build_catalog
+from bench.run import SUBSCRIPTION_CHAT_ID, import_bot
+
+
+def saved_requests(catalog, count):
+    paths = [
+        (brand[0], group[0], generation[0], trim[0])
+        for brand, groups in catalog.items()
+        for group, generations in groups.items()
+        for generation, trims in generations.items()
+        for trim in trims
+    ]
+    requests_ = {}
+    for i in range(count):
+        manufacturer, model_group, model, trim = random.choice(paths)
+        user_id = SUBSCRIPTION_CHAT_ID + i
+        requests_[str(user_id)] = [
+            {
+                "manufacturer": manufacturer,
+                "model_group": model_group,
+                "model": model,
+                "trim": trim,
+                "year_from": 2018,
+                "year_to": 2025,
+                "mileage_from": 0,
+                "mileage_to": 200000,
+                "chat_id": user_id,
+            }
+        ]
+    return requests_
+
+
+def run(args):
+    random.seed(args.seed)
+    catalog = build_catalog()
+    proxy = FakeProxy(catalog).start()
+    encar = FakeEncar().start()
+    telegram = FakeTelegram().start()
+    workdir = tempfile.mkdtemp(prefix="kga-restart-")
+    saved = saved_requests(catalog, args.subscriptions)
+    with open(os.path.join(workdir, "requests.json"), "w", encoding="utf-8") as f:
+        json.dump(saved, f, ensure_ascii=False)
+
+    main = import_bot(proxy.url, encar.url, telegram, args.poll_interval, workdir)
+    main.ACCESS = {int(user_id) for user_id in saved}
+    main.load_requests()
+    scheduled = main.schedule_saved_requests()
+
+    subscribed = {
+        s.user_id
+        for group in main.poll_scheduler.groups.values()
+        for s in group.subscriptions
+    }
+    time.sleep(args.duration)
+    notified = {chat_id for chat_id in main.ACCESS if telegram.replies(chat_id)}
+    return {
+        "saved": args.subscriptions,
+        "scheduled": scheduled,
+        "subscribed_users": len(subscribed),
+        "groups": len(main.poll_scheduler.groups),
+        "notified_chats": len(notified),
+        "catalog_polls": proxy.catalog_requests,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--subscriptions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=3.0, help="секунд опроса")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print(json.dumps(report, ensure_ascii=False))
+    if not (
+        report["scheduled"] == args.subscriptions
+        and report["subscribed_users"] == args.subscriptions
+        and report["notified_chats"]
+    ):
+        sys.exit("Сохранённые запросы не поставлены в опрос после запуска")
@@ -0,0 +1,357 @@
+"""Бенчмарк бота на локальных заглушках прокси, Encar и Telegram.
+
+    python -m bench.run --users 50 --subscriptions 200 --latency-ms 150
+
+N пользователей параллельно проходят мастер поиска (марка → ... → пробег),
+M подписок опрашивают каталог заданное время. В конце печатается пропускная
+способность, p50/p99 задержек, пиковое число потоков и память процесса.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+from bench.fake_servers import FakeEncar, FakeProxy, FakeTelegram, build_catalog
+
+WIZARD_STEPS = (
+    "brand",
+    "model",
+    "generation",
+    "trim",
+    "year_from",
+    "year_to",
+    "mileage_from",
+    "mileage_to",
+)
+FIRST_CHAT_ID = 100_000
+SUBSCRIPTION_CHAT_ID = 500_000
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round(max(values, default=0) * 1000, 1),
+    }
+
+
+def start_servers(args):
+    catalog = build_catalog(args.brands, args.models, args.generations, args.trims)
+    proxy = FakeProxy(
+        catalog,
+        listings_per_query=args.listings,
+        new_rate=args.new_rate,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+    ).start()
+    encar = FakeEncar(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms).start()
+    telegram = FakeTelegram(latency_ms=args.telegram_latency_ms).start()
+    return proxy, encar, telegram
+
+
+def import_bot(proxy_url, encar_url, telegram, poll_interval, workdir):
+    # Настройки читаются при импорте config, поэтому окружение готовим заранее
+    os.environ.update(
+        {
+            "BOT_TOKEN": "1:bench",
+            "PROXY_BASE_URL": proxy_url,
+            "ENCAR_API_URL": encar_url,
+            "TELEGRAM_API_URL": f"{telegram.url}/bot{{0}}/{{1}}",
+            "POLL_INTERVAL": str(poll_interval),
+            # Бюджет и параллельность опроса задаются аргументами стенда
+            "POLL_BUDGET_PER_MINUTE": os.environ.get("POLL_BUDGET_PER_MINUTE", "0"),
+            "POLL_WORKERS": os.environ.get("POLL_WORKERS", "32"),
+            "OUTBOX_WORKERS": os.environ.get("OUTBOX_WORKERS", "16"),
+            "METRICS_PORT": "0",
+            "CATALOG_CRAWL": "0",
+            "CAPTURE_FILE": "",
+            "TRACE_FILE": os.path.join(workdir, "slow_traces.log"),
+            "HISTORY_FILE": os.path.join(workdir, "history.sqlite3"),
+            "SEEN_FILTER_FILE": os.path.join(workdir, "seen.bloom"),
+            "OUTBOX_FILE": os.path.join(workdir, "outbox.sqlite3"),
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        }
+    )
+    if "config" in sys.modules:
+        # config мог быть уже импортирован (например, через capture) со старым окружением
+        importlib.reload(sys.modules["config"])
+    import main
+
+    main.REQUESTS_FILE = os.path.join(workdir, "requests.json")
+    main.notification_outbox.start()
+    return main
+
+
+def callback_update(update_id, chat_id, data, text, message_id):
+    from telebot import types
+
+    user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+    return types.Update.de_json(
+        {
+            "update_id": update_id,
+            "callback_query": {
+                "id": f"{chat_id}-{update_id}",
+                "chat_instance": str(chat_id),
+                "data": data,
+                "from": user,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": user,
+                    "text": text,
+                },
+            },
+        }
+    )
+
+
+class Wizard:
+    def __init__(self, main, telegram, timeout):
+        self.main = main
+        self.telegram = telegram
+        self.timeout = timeout
+        self.latencies = {step: [] for step in ("search_car",) + WIZARD_STEPS}
+        self.failures = 0
+        self._update_ids = iter(range(1, 10**9))
+        self._lock = threading.Lock()
+
+    def click(self, chat_id, data, step):
+        seen = self.telegram.replies(chat_id)
+        with self._lock:
+            update_id = next(self._update_ids)
+        update = callback_update(
+            update_id, chat_id, data, self.telegram.last_text.get(chat_id, ""), 1
+        )
+        started = time.perf_counter()
+        self.main.bot.process_new_updates([update])
+        if not self.telegram.wait_reply(chat_id, seen, self.timeout):
+            with self._lock:
+                self.failures += 1
+            return False
+        with self._lock:
+            self.latencies[step].append(time.perf_counter() - started)
+        return True
+
+    def run_user(self, chat_id):
+        if not self.click(chat_id, "search_car", "search_car"):
+            return
+        for step in WIZARD_STEPS:
+            buttons = [
+                button
+                for button in self.telegram.buttons(chat_id)
+                if button.get("callback_data", "").startswith(f"{step}:")
+            ]
+            if not buttons:
+                with self._lock:
+                    self.failures += 1
+                return
+            if step == "mileage_from":
+                # После максимального минимального пробега выбирать уже нечего
+                buttons = buttons[:-1] or buttons
+            if not self.click(chat_id, random.choice(buttons)["callback_data"], step):
+                return
+
+
+def sample_threads(stop, peak):
+    while not stop.is_set():
+        peak[0] = max(peak[0], threading.active_count())
+        time.sleep(0.05)
+
+
+def run(args):
+    random.seed(args.seed)
+    proxy, encar, telegram = start_servers(args)
+    workdir = tempfile.mkdtemp(prefix="kga-bench-")
+    main = import_bot(proxy.url, encar.url, telegram, args.poll_interval, workdir)
+    # Уведомления уходят только чатам с доступом, подписчикам стенда тоже
+    main.ACCESS = set(range(FIRST_CHAT_ID, FIRST_CHAT_ID + args.users)) | set(
+        range(SUBSCRIPTION_CHAT_ID, SUBSCRIPTION_CHAT_ID + args.subscriptions)
+    )
+
+    upstream = {"nav": [], "catalog": [], "vehicle": []}
+    original_upstream_get = main.upstream_get
+
+    def timed_upstream_get(url, kind, headers=None):
+        started = time.perf_counter()
+        try:
+            return original_upstream_get(url, kind, headers=headers)
+        finally:
+            upstream.setdefault(kind, []).append(time.perf_counter() - started)
+
+    main.upstream_get = timed_upstream_get
+
+    stop = threading.Event()
+    peak_threads = [threading.active_count()]
+    threading.Thread(
+        target=sample_threads, args=(stop, peak_threads), daemon=True
+    ).start()
+
+    # Мастер поиска: N пользователей одновременно
+    wizard = Wizard(main, telegram, args.timeout)
+    started = time.perf_counter()
+    users = [
+        threading.Thread(target=wizard.run_user, args=(FIRST_CHAT_ID + i,))
+        for i in range(args.users)
+    ]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    wizard_elapsed = time.perf_counter() - started
+    wizard_clicks = sum(len(values) for values in wizard.latencies.values())
+
+    # Опрос: M подписок на случайные комплектации
+    catalog_before = proxy.catalog_requests
+    served_before = proxy.listings_served
+    parsed_before = main.metrics.LISTINGS_PARSED.labels().value
+    sent_before = telegram.calls.get("sendMessage", 0)
+    paths = [
+        (brand[0], group[0], generation[0], trim[0])
+        for brand, groups in proxy.catalog.items()
+        for group, generations in groups.items()
+        for generation, trims in generations.items()
+        for trim in trims
+    ]
+    started = time.perf_counter()
+    for i in range(args.subscriptions):
+        manufacturer, model_group, model, trim = random.choice(paths)
+        main.add_search_request(
+            SUBSCRIPTION_CHAT_ID + i,
+            SUBSCRIPTION_CHAT_ID + i,
+            {
+                "manufacturer": manufacturer,
+                "model_group": model_group,
+                "model": model,
+                "trim": trim,
+                "year_from": 2018,
+                "year_to": 2025,
+                "mileage_from": 0,
+                "mileage_to": 200000,
+            },
+        )
+    time.sleep(args.duration)
+    polling_elapsed = time.perf_counter() - started
+    catalog_polls = proxy.catalog_requests - catalog_before
+    notifications = telegram.calls.get("sendMessage", 0) - sent_before
+    listings_served = proxy.listings_served - served_before
+    listings_parsed = int(main.metrics.LISTINGS_PARSED.labels().value - parsed_before)
+    stop.set()
+
+    report = {
+        "wizard": {
+            "users": args.users,
+            "clicks": wizard_clicks,
+            "failures": wizard.failures,
+            "elapsed_s": round(wizard_elapsed, 2),
+            "clicks_per_s": (
+                round(wizard_clicks / wizard_elapsed, 1) if wizard_elapsed else 0
+            ),
+            "latency": summary(
+                [v for values in wizard.latencies.values() for v in values]
+            ),
+            "steps": {
+                step: summary(values) for step, values in wizard.latencies.items()
+            },
+        },
+        "polling": {
+            "subscriptions": args.subscriptions,
+            "elapsed_s": round(polling_elapsed, 2),
+            "catalog_polls": catalog_polls,
+            "polls_per_s": round(catalog_polls / polling_elapsed, 1),
+            "notifications": notifications,
+            "listings_served": listings_served,
+            "listings_parsed": listings_parsed,
+        },
+        "upstream": {kind: summary(values) for kind, values in upstream.items()},
+        "proxy_requests": {
+            "nav": proxy.nav_requests,
+            "catalog": proxy.catalog_requests,
+        },
+        "telegram_calls": dict(telegram.calls),
+        "peak_threads": peak_threads[0],
+        "max_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+    return report
+
+
+def print_report(report):
+    wizard = report["wizard"]
+    polling = report["polling"]
+    print("=== Мастер поиска ===")
+    print(
+        f"пользователей {wizard['users']}, кликов {wizard['clicks']} "
+        f"({wizard['failures']} сбоев) за {wizard['elapsed_s']} с — "
+        f"{wizard['clicks_per_s']} кликов/с"
+    )
+    print(f"{'шаг':<14}{'n':>6}{'p50, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for step, stats in list(wizard["steps"].items()) + [("всего", wizard["latency"])]:
+        print(
+            f"{step:<14}{stats['count']:>6}{stats['p50_ms']:>10}"
+            f"{stats['p99_ms']:>10}{stats['max_ms']:>10}"
+        )
+    print("=== Опрос каталога ===")
+    print(
+        f"подписок {polling['subscriptions']}, опросов {polling['catalog_polls']} "
+        f"за {polling['elapsed_s']} с — {polling['polls_per_s']} опросов/с, "
+        f"уведомлений {polling['notifications']}"
+    )
+    print(
+        f"объявлений в ответах {polling['listings_served']}, "
+        f"разобрано {polling['listings_parsed']}"
+    )
+    for kind, stats in report["upstream"].items():
+        print(
+            f"{kind:<14}{stats['count']:>6}{stats['p50_ms']:>10}{stats['p99_ms']:>10}"
+        )
+    print(f"запросы к прокси: {report['proxy_requests']}")
+    print(f"вызовы Telegram: {report['telegram_calls']}")
+    print(f"пик потоков: {report['peak_threads']}, max RSS: {report['max_rss_mb']} МБ")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--subscriptions", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="секунд опроса")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30.0)
+    parser.add_argument("--brands", type=int, default=40)
+    parser.add_argument("--models", type=int, default=8)
+    parser.add_argument("--generations", type=int, default=3)
+    parser.add_argument("--trims", type=int, default=4)
+    parser.add_argument("--listings", type=int, default=20)
+    parser.add_argument("--new-rate", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить отчёт в JSON-файл")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
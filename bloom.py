@@ -0,0 +1,117 @@
+"""Масштабируемый фильтр Блума для проверки «видели ли уже».
+
+Отрицательный ответ точный, положительный — с вероятностью ошибки не выше
+error_rate, поэтому за попаданием должна следовать проверка в точном
+хранилище. Когда фильтр заполняется, добавляется следующий, вдвое больший
+и с вдвое меньшей долей ошибок, так что общая доля ошибок остаётся
+ограниченной при любом числе ключей.
+"""
+
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+
+_MAGIC = b"KGABLOOM"
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = (size + 7) // 8 * 8
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(self.size // 8) if bits is None else bits
+        self.count = count
+
+    def _positions(self, key):
+        # Двойное хэширование: k позиций из двух 64-битных половин одного хэша
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter:
+    def __init__(self, capacity=10000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filters = []
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return any(key in f for f in reversed(self.filters))
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    def add(self, key):
+        with self._lock:
+            if key in self:
+                return
+            if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+                n = len(self.filters)
+                self.filters.append(
+                    BloomFilter(self.capacity * 2**n, self.error_rate / 2 ** (n + 1))
+                )
+            self.filters[-1].add(key)
+
+    @property
+    def nbytes(self):
+        return sum(len(f.bits) for f in self.filters)
+
+    def save(self, path):
+        with self._lock:
+            header = json.dumps(
+                {
+                    "capacity": self.capacity,
+                    "error_rate": self.error_rate,
+                    "filters": [
+                        [f.capacity, f.error_rate, f.count] for f in self.filters
+                    ],
+                }
+            ).encode("utf-8")
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_MAGIC + struct.pack("<I", len(header)) + header)
+                for bloom in self.filters:
+                    f.write(bloom.bits)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Фильтр из файла save(); ValueError, если файл повреждён."""
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(_MAGIC):
+            raise ValueError(f"{path}: не файл фильтра Блума")
+        offset = len(_MAGIC) + 4
+        if len(data) < offset:
+            raise ValueError(f"{path}: файл обрезан")
+        (length,) = struct.unpack_from("<I", data, len(_MAGIC))
+        try:
+            header = json.loads(data[offset : offset + length])
+            scalable = cls(header["capacity"], header["error_rate"])
+            filters = [tuple(f) for f in header["filters"]]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"{path}: повреждён заголовок: {e!r}") from e
+        offset += length
+        for capacity, error_rate, count in filters:
+            bloom = BloomFilter(capacity, error_rate, count=count)
+            end = offset + len(bloom.bits)
+            if end > len(data):
+                raise ValueError(f"{path}: файл обрезан")
+            bloom.bits = bytearray(data[offset:end])
+            offset = end
+            scalable.filters.append(bloom)
+        return scalable
@@ -0,0 +1,136 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, touch=True):
+        # touch=False читает, не продлевая запись в очереди вытеснения
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            if touch:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, touch=True):
+        # touch=False кладёт новую запись первой на вытеснение, а существующую
+        # обновляет на месте: фоновые записи не вытесняют то, что читают люди
+        with self._lock:
+            is_new = key not in self._entries
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            if touch:
+                self._entries.move_to_end(key)
+            elif is_new:
+                self._entries.move_to_end(key, last=False)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одним ключом: функция выполняется
+    один раз, остальные потоки ждут и получают тот же результат (или ту же
+    ошибку). После завершения ключ освобождается, результат не кэшируется."""
+
+    def __init__(self, on_shared=None):
+        self._calls = {}
+        self._lock = threading.Lock()
+        # on_shared() вызывается для каждого потока, получившего чужой результат
+        self.on_shared = on_shared
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if self.on_shared is not None:
+                self.on_shared()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class ResponseValidators:
+    """ETag, Last-Modified и хэш тела последнего обработанного ответа по ключу
+    запроса. headers() — заголовки условного запроса, unchanged() — ответ тот
+    же, что и в прошлый раз (304 или совпал хэш тела, если прокси не отдаёт
+    валидаторы). remember() вызывается только после того, как ответ
+    обработан: иначе сбой обработки спрятал бы его за 304 навсегда."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def headers(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return {}
+        etag, last_modified, _ = entry
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def unchanged(self, key, response):
+        if response.status_code == 304:
+            return True
+        with self._lock:
+            previous = self._entries.get(key)
+        return (
+            previous is not None
+            and previous[2] == hashlib.sha1(response.content).digest()
+        )
+
+    def remember(self, key, response):
+        entry = (
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            hashlib.sha1(response.content).digest(),
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -0,0 +1,149 @@
+import atexit
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import queue
+import threading
+import time
+
+from log import get_logger
+
+logger = get_logger("capture")
+
+# Поля с личными данными: first_name обязателен в User, остальные выбрасываются
+_PERSONAL_FIELDS = {"last_name", "username", "phone_number", "bio", "vcard"}
+# Объекты, у которых id — это пользователь или чат
+_IDENTITY_KEYS = {"from", "chat", "user", "sender_chat"}
+
+
+class Anonymizer:
+    """Заменяет id пользователей и чатов стабильными псевдонимами. Соль
+    случайная и нигде не сохраняется, поэтому исходные id не восстановить."""
+
+    def __init__(self, salt=None):
+        self.salt = salt or os.urandom(16)
+
+    def user_id(self, value):
+        digest = hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()
+        return 10**9 + int.from_bytes(digest[:6], "big") % 10**9
+
+    def query(self, value):
+        # Одинаковые запросы остаются одинаковыми, но сам текст не сохраняется
+        return hmac.new(self.salt, value.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def update(self, obj, key=None):
+        if isinstance(obj, list):
+            return [self.update(item) for item in obj]
+        if not isinstance(obj, dict):
+            return obj
+        result = {}
+        for name, value in obj.items():
+            if name in _PERSONAL_FIELDS:
+                continue
+            if name == "first_name":
+                result[name] = "user"
+            elif name == "id" and key in _IDENTITY_KEYS:
+                result[name] = self.user_id(value)
+            elif name == "user_id" and key == "contact":
+                result[name] = self.user_id(value)
+            elif name == "query" and key in ("inline_query", "chosen_inline_result"):
+                result[name] = self.query(value)
+            elif name == "text" and not obj.get("from", {}).get("is_bot", True):
+                result[name] = self.text(value)
+            else:
+                result[name] = self.update(value, name)
+        return result
+
+    @staticmethod
+    def text(value):
+        # Текст сообщений бота нужен обработчикам кнопок и сохраняется как есть,
+        # от пользователя остаются только команды без аргументов
+        if value.startswith("/"):
+            return value.split(maxsplit=1)[0]
+        return "…"
+
+
+class CaptureRecorder:
+    """Пишет входящие обновления и ответы внешних API в сжатый JSONL для
+    последующего воспроизведения (bench/replay.py). Запись идёт из отдельного
+    потока; пока запись не включена, все методы ничего не делают."""
+
+    def __init__(self):
+        self.enabled = False
+        self.anonymizer = Anonymizer()
+        self.dropped = 0
+        self._queue = None
+        self._writer = None
+        self._started = 0.0
+
+    def start(self, path, queue_size=10000, **meta):
+        self._queue = queue.Queue(queue_size)
+        self._started = time.monotonic()
+        self._writer = threading.Thread(
+            target=self._write, args=(path,), name="capture", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.stop)
+        self.enabled = True
+        self._put({"k": "meta", "v": 1, "started": round(time.time()), **meta})
+        logger.info("Запись трафика в %s", path)
+
+    def stop(self):
+        if self.enabled:
+            self.enabled = False
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+
+    def record_update(self, update):
+        if self.enabled:
+            self._put({"k": "update", "d": self.anonymizer.update(update)})
+
+    def record_upstream(self, kind, url, status, body):
+        if self.enabled:
+            self._put(
+                {"k": "upstream", "kind": kind, "url": url, "s": status, "b": body}
+            )
+
+    def record_subscriptions(self, user_requests):
+        if self.enabled:
+            # В запросе сохранён и чат уведомлений — его id тоже заменяем
+            anonymized = {
+                str(self.anonymizer.user_id(user_id)): [
+                    (
+                        {
+                            **search,
+                            "chat_id": self.anonymizer.user_id(search["chat_id"]),
+                        }
+                        if "chat_id" in search
+                        else search
+                    )
+                    for search in searches
+                ]
+                for user_id, searches in user_requests.items()
+            }
+            self._put({"k": "subscriptions", "d": anonymized})
+
+    def _put(self, record):
+        record["t"] = round(time.monotonic() - self._started, 3)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self, path):
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            while (record := self._queue.get()) is not None:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+
+
+def read_capture(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+capture = CaptureRecorder()
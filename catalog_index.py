@@ -0,0 +1,137 @@
+import hashlib
+import heapq
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+# Уровни дерева каталога в порядке вложенности
+LEVELS = ("brands", "models", "generations", "trims")
+
+_SPLIT_RE = re.compile(r"[\s()\[\]_/,.\-]+")
+
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text):
+    return [token for token in _SPLIT_RE.split(normalize(text)) if token]
+
+
+def trigrams(token):
+    # Отступ только слева: так префикс недописанного слова ("gran") тоже находится
+    padded = f"  {token}"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def document_id(path):
+    raw = "\x1f".join(path)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class CatalogIndex:
+    """Триграммный индекс по дереву каталога для inline-поиска.
+
+    Узлы всех уровней запоминаются по пути из корейских названий
+    (марка, группа моделей, модель, комплектация); в поиск попадают
+    комплектации, а их текст собирается из названий всех предков:
+    корейских, английских и переведённых.
+    """
+
+    def __init__(self, translate=None):
+        self.translate = translate or (lambda phrase: phrase)
+        self._nodes = {}
+        self._documents = {}
+        self._words = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add_level(self, level, parent_path, items):
+        is_leaf = level == LEVELS[-1]
+        with self._lock:
+            for item in items:
+                kr_name = item.get("DisplayValue", "")
+                if not kr_name:
+                    continue
+                eng_name = item.get("Metadata", {}).get("EngName", [""])[0]
+                path = tuple(parent_path) + (kr_name,)
+                self._nodes[path] = {
+                    "names": {
+                        kr_name,
+                        eng_name,
+                        self.translate(kr_name),
+                        self.translate(eng_name),
+                    }
+                    - {""},
+                    "eng_name": eng_name,
+                    "metadata": item.get("Metadata", {}),
+                }
+                if is_leaf:
+                    self._add_document(path)
+
+    def node(self, path):
+        return self._nodes.get(tuple(path))
+
+    def document(self, doc_id):
+        return self._documents.get(doc_id)
+
+    def _add_document(self, path):
+        doc_id = document_id(path)
+        if doc_id in self._documents:
+            self._remove_postings(doc_id)
+
+        words = set()
+        for depth in range(1, len(path) + 1):
+            node = self._nodes.get(path[:depth])
+            names = node["names"] if node else {path[depth - 1]}
+            for name in names:
+                words.update(tokenize(name))
+
+        self._documents[doc_id] = path
+        self._words[doc_id] = words
+        for word in words:
+            for gram in trigrams(word):
+                self._postings.setdefault(gram, set()).add(doc_id)
+
+    def _remove_postings(self, doc_id):
+        for word in self._words.pop(doc_id, ()):
+            for gram in trigrams(word):
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(doc_id)
+
+    def search(self, query, limit=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        scores = Counter()
+        with self._lock:
+            for token in tokens:
+                grams = trigrams(token)
+                hits = Counter()
+                for gram in grams:
+                    for doc_id in self._postings.get(gram, ()):
+                        hits[doc_id] += 1
+                for doc_id, count in hits.items():
+                    score = count / len(grams)
+                    words = self._words[doc_id]
+                    if token in words:
+                        score += 0.5
+                    elif any(word.startswith(token) for word in words):
+                        score += 0.25
+                    scores[doc_id] += score
+
+            # При равном счёте выше более короткие (точнее совпадающие) документы
+            ranked = heapq.nlargest(
+                limit,
+                scores.items(),
+                key=lambda pair: (pair[1], -len(self._words[pair[0]])),
+            )
+            return [
+                (doc_id, self._documents[doc_id], score) for doc_id, score in ranked
+            ]
@@ -0,0 +1,102 @@
+import os
+
+# Клавиатуры
+KEYBOARD_PAGE_SIZE = int(os.getenv("KEYBOARD_PAGE_SIZE", "20"))
+
+# Пулы потоков: обработчики апдейтов и медленные маршруты/фоновые задачи.
+# При переполненной очереди пользователь сразу получает ответ «бот занят»
+HANDLER_WORKERS = int(os.getenv("HANDLER_WORKERS", "8"))
+HANDLER_QUEUE_SIZE = int(os.getenv("HANDLER_QUEUE_SIZE", "200"))
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "16"))
+BACKGROUND_QUEUE_SIZE = int(os.getenv("BACKGROUND_QUEUE_SIZE", "500"))
+
+# Внешние API. Переопределяются, например, для стендов бенчмарка
+PROXY_BASE_URL = os.getenv("PROXY_BASE_URL", "https://bazarishauto-proxy.onrender.com")
+ENCAR_API_URL = os.getenv("ENCAR_API_URL", "https://api.encar.com")
+# Формат telebot: "https://api.telegram.org/bot{0}/{1}", пусто — адрес по умолчанию
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Интервал опроса каталога по каждому запросу пользователя, секунды
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "300"))
+# Общий бюджет запросов каталога к прокси в минуту (0 — без ограничения) и
+# число одновременных опросов. Бюджет делится между пользователями поровну,
+# сколько бы запросов у каждого ни было
+POLL_BUDGET_PER_MINUTE = float(os.getenv("POLL_BUDGET_PER_MINUTE", "120"))
+POLL_WORKERS = int(os.getenv("POLL_WORKERS", "4"))
+# Сохранённых запросов на пользователя, 0 — без ограничения
+MAX_REQUESTS_PER_USER = int(os.getenv("MAX_REQUESTS_PER_USER", "20"))
+# Приоритетный тариф (менеджеры): вес в бюджете и более частый опрос
+PRIORITY_USER_IDS = {
+    int(user_id)
+    for user_id in os.getenv("PRIORITY_USER_IDS", "604303416,728438182").split(",")
+    if user_id.strip()
+}
+PRIORITY_WEIGHT = float(os.getenv("PRIORITY_WEIGHT", "4"))
+PRIORITY_POLL_INTERVAL = float(
+    os.getenv("PRIORITY_POLL_INTERVAL", str(POLL_INTERVAL / 4))
+)
+
+# История объявлений (цены, пробег) для уведомлений о снижении цены и
+# повторном размещении; повторным считается объявление, которого не было в
+# выдаче RELIST_AFTER_DAYS суток и которое заново размещено на Encar
+HISTORY_FILE = os.getenv("HISTORY_FILE", "history.sqlite3")
+RELIST_AFTER_DAYS = float(os.getenv("RELIST_AFTER_DAYS", "7"))
+# /stats считается по объявлениям, бывшим в выдаче за столько суток
+STATS_WINDOW_DAYS = float(os.getenv("STATS_WINDOW_DAYS", "30"))
+# Фильтр Блума просмотренных объявлений перед историей; интервал сохранения
+# на диск, секунды
+SEEN_FILTER_FILE = os.getenv("SEEN_FILTER_FILE", "seen.bloom")
+SEEN_FILTER_SAVE_INTERVAL = float(os.getenv("SEEN_FILTER_SAVE_INTERVAL", "60"))
+
+# Очередь уведомлений на диске: доставка переживает перезапуск без потерь
+# и повторов. Неудачная отправка повторяется с растущей паузой
+OUTBOX_FILE = os.getenv("OUTBOX_FILE", "outbox.sqlite3")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+# Таймаут запросов к прокси каталога и API Encar, секунды
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30"))
+
+# Кэш навигации по каталогу (марки, модели, поколения, комплектации), секунды
+NAV_CACHE_TTL = int(os.getenv("NAV_CACHE_TTL", "900"))
+
+# Фоновый обход каталога для inline-поиска
+CATALOG_CRAWL = os.getenv("CATALOG_CRAWL", "1") == "1"
+CATALOG_CRAWL_DELAY = float(os.getenv("CATALOG_CRAWL_DELAY", "1.0"))
+CATALOG_CRAWL_INTERVAL = int(os.getenv("CATALOG_CRAWL_INTERVAL", "86400"))
+# Пустой уровень каталога (прокси ещё просыпается) запрашивается повторно
+# с удваивающейся паузой; неудачный обход повторяется так же, а не через сутки
+CATALOG_CRAWL_RETRIES = int(os.getenv("CATALOG_CRAWL_RETRIES", "3"))
+CATALOG_CRAWL_RETRY_DELAY = float(os.getenv("CATALOG_CRAWL_RETRY_DELAY", "10"))
+
+# Логирование
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Бюджет времени на запуск до начала опроса Telegram, миллисекунды
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "3000"))
+
+# Метрики в формате Prometheus, 0 — не поднимать HTTP-сервер
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Трассировка обработчиков: медленные трассы пишутся в файл с ротацией
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_FILE = os.getenv("TRACE_FILE", "slow_traces.log")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+
+# Запись анонимизированного трафика для bench/replay.py, пусто — не писать
+CAPTURE_FILE = os.getenv("CAPTURE_FILE", "")
+
+# Вебхук вместо long polling: публичный адрес, пусто — опрос getUpdates.
+# TLS завершается на обратном прокси, сервер бота слушает HTTP
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Пусто — секрет генерируется при каждом запуске
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
@@ -0,0 +1,290 @@
+"""История объявлений в локальной SQLite.
+
+Каждое объявление, которое вернул опрос, записывается с ценой и пробегом;
+изменения цены и пробега копятся в price_history. Объявления связаны с
+каноническим запросом (query_hash), которым их нашли. Сравнение идёт только
+с последней записью по Id, так что стоимость опроса не зависит от размера
+истории.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import metrics
+from bloom import ScalableBloomFilter
+from listings import listing_version
+from log import get_logger
+
+logger = get_logger("history")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    id TEXT PRIMARY KEY,
+    price REAL,
+    mileage INTEGER,
+    modified TEXT,
+    first_seen REAL NOT NULL,
+    last_changed REAL NOT NULL,
+    last_listed REAL,
+    manufacturer TEXT,
+    model_group TEXT,
+    model TEXT,
+    trim TEXT,
+    form_year TEXT
+);
+CREATE TABLE IF NOT EXISTS price_history (
+    id TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    price REAL,
+    mileage INTEGER
+);
+CREATE INDEX IF NOT EXISTS price_history_id ON price_history (id, seen_at);
+CREATE TABLE IF NOT EXISTS query_listings (
+    query TEXT NOT NULL,
+    id TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (query, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS query_listings_id ON query_listings (id);
+"""
+
+
+# Столбцы, добавленные после первой версии схемы: (имя, тип)
+_ADDED_COLUMNS = (
+    ("last_listed", "REAL"),
+    ("manufacturer", "TEXT"),
+    ("model_group", "TEXT"),
+    ("model", "TEXT"),
+    ("trim", "TEXT"),
+    ("form_year", "TEXT"),
+)
+
+
+class Change(NamedTuple):
+    kind: str  # new | price_drop | relisted
+    previous_price: Optional[float] = None
+
+
+class ListingHistory:
+    """classify(cars) — Change или None для каждого объявления опроса, если
+    сообщать не о чем; record(query_key, catalog, cars) записывает их. Между
+    этими шагами уведомления попадают в outbox: упав до record(), опрос
+    повторится и классифицирует объявления так же.
+
+    last_changed — когда записана последняя версия объявления, last_listed —
+    когда оно последний раз было в ответе каталога (mark_listed). Повторное
+    размещение — объявление, которого не было в выдаче relist_after секунд
+    и которое, по advertised_since(car) (время размещения на Encar или
+    None), размещено заново уже после этого. Правка объявления, не
+    снимавшегося с продажи, повторным размещением не считается."""
+
+    def __init__(self, path, relist_after, advertised_since=None):
+        self.relist_after = relist_after
+        self.advertised_since = advertised_since
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(listings)")}
+        if "last_seen" in columns:
+            # До last_listed столбец назывался last_seen, хотя обновлялся
+            # только при изменении объявления
+            self._db.execute(
+                "ALTER TABLE listings RENAME COLUMN last_seen TO last_changed"
+            )
+        for name, kind in _ADDED_COLUMNS:
+            if name not in columns:
+                self._db.execute(f"ALTER TABLE listings ADD COLUMN {name} {kind}")
+        with self._db:
+            self._db.execute(
+                "UPDATE listings SET last_listed = last_changed"
+                " WHERE last_listed IS NULL"
+            )
+        # Растёт при каждой записи: по нему статистика понимает, что данные
+        # изменились
+        self.version = 0
+
+    def _row(self, car_id):
+        return self._db.execute(
+            "SELECT price, mileage, modified, last_listed FROM listings WHERE id = ?",
+            (car_id,),
+        ).fetchone()
+
+    def classify(self, cars, now=None):
+        """cars — пары (объявление, комплектация); в историю ничего не пишет."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = [self._row(str(car["Id"])) for car, _ in cars]
+        changes = []
+        for (car, _), row in zip(cars, rows):
+            change = self._change(row, car.get("Price"), car.get("ModifiedDate"), now)
+            if change is not None and change.kind == "relisted":
+                # Кандидата подтверждаем по Encar: размещено ли объявление
+                # заново после того, как пропало из выдачи
+                advertised = self.advertised_since and self.advertised_since(car)
+                if advertised is None or advertised <= row[3]:
+                    change = None
+            changes.append(change)
+        return changes
+
+    def record(self, query_key, catalog, cars, now=None):
+        """catalog — (manufacturer, model_group, model) группы опроса,
+        cars — пары (объявление, комплектация)."""
+        now = time.time() if now is None else now
+        with self._lock, self._db:
+            for car, trim in cars:
+                car_id = str(car["Id"])
+                price = car.get("Price")
+                mileage = car.get("Mileage")
+                modified = car.get("ModifiedDate")
+                labels = (*catalog, trim, car.get("FormYear"))
+                row = self._row(car_id)
+                if row is None:
+                    self._db.execute(
+                        "INSERT INTO listings (id, price, mileage, modified,"
+                        " first_seen, last_changed, last_listed, manufacturer,"
+                        " model_group, model, trim, form_year)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (car_id, price, mileage, modified, now, now, now, *labels),
+                    )
+                else:
+                    self._db.execute(
+                        "UPDATE listings SET price = ?, mileage = ?, modified = ?,"
+                        " last_changed = ?, last_listed = ?, manufacturer = ?,"
+                        " model_group = ?, model = ?, trim = ?, form_year = ?"
+                        " WHERE id = ?",
+                        (price, mileage, modified, now, now, *labels, car_id),
+                    )
+                if row is None or (row[0], row[1]) != (price, mileage):
+                    self._db.execute(
+                        "INSERT INTO price_history VALUES (?, ?, ?, ?)",
+                        (car_id, now, price, mileage),
+                    )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_listings VALUES (?, ?, ?)",
+                    (query_key, car_id, now),
+                )
+            if cars:
+                self.version += 1
+
+    def mark_listed(self, car_ids, now=None):
+        """Объявления car_ids есть в ответе каталога, в том числе
+        просмотренные и неизменившиеся."""
+        if not car_ids:
+            return
+        now = time.time() if now is None else now
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE listings SET last_listed = ? WHERE id = ?",
+                [(now, str(car_id)) for car_id in car_ids],
+            )
+
+    def _change(self, row, price, modified, now):
+        if row is None:
+            return Change("new")
+        previous_price, _, previous_modified, last_listed = row
+        if previous_modified == modified:
+            # Та же версия объявления, например после перезапуска бота
+            return None
+        if price is not None and previous_price is not None and price < previous_price:
+            return Change("price_drop", previous_price)
+        if now - last_listed >= self.relist_after:
+            return Change("relisted")
+        return None
+
+    def has_version(self, version):
+        """Записана ли в истории именно эта версия объявления."""
+        car_id = version.partition("@")[0]
+        with self._lock:
+            row = self._db.execute(
+                "SELECT modified FROM listings WHERE id = ?", (car_id,)
+            ).fetchone()
+        return (
+            row is not None
+            and listing_version({"Id": car_id, "ModifiedDate": row[0]}) == version
+        )
+
+    def versions(self):
+        with self._lock:
+            rows = self._db.execute("SELECT id, modified FROM listings").fetchall()
+        return [listing_version({"Id": id, "ModifiedDate": m}) for id, m in rows]
+
+    def prices(self, car_id):
+        """История (время, цена, пробег) объявления по возрастанию времени."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT seen_at, price, mileage FROM price_history"
+                " WHERE id = ? ORDER BY seen_at",
+                (str(car_id),),
+            ).fetchall()
+
+    def catalog_rows(self, listed_since=0.0):
+        """(manufacturer, model_group, model, trim, price, mileage, form_year)
+        объявлений, бывших в выдаче с listed_since, — исходные данные для
+        статистики рынка."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT manufacturer, model_group, model, trim, price, mileage,"
+                " form_year FROM listings WHERE last_listed >= ?",
+                (listed_since,),
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SeenVersions:
+    """Просмотренные версии объявлений для всех групп опроса.
+
+    Фильтр Блума в памяти отвечает «не видели» без обращения к SQLite; на
+    попадание (в том числе ложное) версия проверяется в истории. Фильтр
+    сохраняется в файл и при запуске загружается из него, а если файла нет
+    или он повреждён — собирается заново из истории."""
+
+    def __init__(self, history, path):
+        self.history = history
+        self.path = path
+        self._dirty = False
+        try:
+            self.filter = ScalableBloomFilter.load(path)
+        except FileNotFoundError:
+            self.filter = self._rebuild()
+        except (OSError, ValueError) as e:
+            logger.warning("Фильтр просмотренных %s не загружен: %s", path, e)
+            self.filter = self._rebuild()
+        metrics.SEEN_FILTER_BYTES.set_function(lambda: self.filter.nbytes)
+
+    def _rebuild(self):
+        bloom = ScalableBloomFilter()
+        for version in self.history.versions():
+            bloom.add(version)
+        self._dirty = True
+        return bloom
+
+    def __contains__(self, version):
+        if version not in self.filter:
+            metrics.SEEN_FILTER_CHECKS.labels("miss").inc()
+            return False
+        if self.history.has_version(version):
+            metrics.SEEN_FILTER_CHECKS.labels("hit").inc()
+            return True
+        metrics.SEEN_FILTER_CHECKS.labels("false_positive").inc()
+        return False
+
+    def add(self, version):
+        self.filter.add(version)
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        try:
+            self.filter.save(self.path)
+        except OSError as e:
+            self._dirty = True
+            logger.warning("Фильтр просмотренных не сохранён: %s", e)
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from telebot import types
+
+from router import callback_data
+from tracing import span
+
+
+def catalog_version(facets):
+    """Отпечаток снимка nav: меняется только при изменении того, что попадает в кнопки."""
+    snapshot = [
+        (item.get("Value"), item.get("DisplayValue"), item.get("Metadata"))
+        for item in facets
+    ]
+    raw = json.dumps(snapshot, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class KeyboardCache:
+    """Хранит уже сериализованную разметку клавиатур.
+
+    Ключ — (меню, параметры), к записи привязана версия каталога: если снимок
+    nav изменился, запись пересобирается. Значение — готовая JSON-строка,
+    которую telebot отправляет как есть.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, menu, params, build, version=None):
+        key = (menu, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        with span(f"keyboard:{menu}"):
+            blob = build().to_json()
+
+        with self._lock:
+            self._entries[key] = (version, blob)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return blob
+
+    def invalidate(self, menu=None):
+        with self._lock:
+            if menu is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == menu]:
+                del self._entries[key]
+
+
+def paginate(items, page, page_size):
+    """Срез одной страницы из уже отсортированного списка."""
+    pages = max(1, -(-len(items) // page_size))
+    page = min(max(page, 0), pages - 1)
+    start = page * page_size
+    return items[start : start + page_size], page, pages
+
+
+def alphabet_index(items, key, page_size):
+    """Первая буква -> номер страницы, на которой начинаются элементы с этой буквы."""
+    index = OrderedDict()
+    for position, item in enumerate(items):
+        letter = (key(item) or "#")[:1].upper()
+        if not letter.isalpha():
+            letter = "#"
+        index.setdefault(letter, position // page_size)
+    return index
+
+
+def add_page_navigation(markup, page, pages, action):
+    if pages <= 1:
+        return
+    row = []
+    if page > 0:
+        row.append(
+            types.InlineKeyboardButton(
+                "◀️", callback_data=callback_data(action, page - 1)
+            )
+        )
+    row.append(types.InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop"))
+    if page < pages - 1:
+        row.append(
+            types.InlineKeyboardButton(
+                "▶️", callback_data=callback_data(action, page + 1)
+            )
+        )
+    markup.row(*row)
+
+
+def add_alphabet_index(markup, index, action, per_row=8):
+    buttons = [
+        types.InlineKeyboardButton(letter, callback_data=callback_data(action, page))
+        for letter, page in index.items()
+    ]
+    for start in range(0, len(buttons), per_row):
+        markup.row(*buttons[start : start + per_row])
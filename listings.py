@@ -0,0 +1,148 @@
+"""Разбор ответа каталога без построения полного дерева JSON.
+
+Объявление в ответе прокси — это сотня полей с фотографиями и опциями, а боту
+нужны единицы. Тело ответа декодируется в строку целиком, но дерево JSON не
+строится: объекты SearchResults разбираются по одному, от каждого остаются
+только LISTING_FIELDS, и разбор прекращается, как только пошли уже
+просмотренные версии объявлений. Страница выдачи — по несколько объявлений
+на комплектацию (query.newest_first), так что обычно до конца она не
+разбирается.
+"""
+
+import json
+import re
+
+# Поля, которые нужны опросу (комплектация, фильтры) и тексту уведомления
+LISTING_FIELDS = (
+    "Id",
+    "Manufacturer",
+    "Model",
+    "Badge",
+    "BadgeGroup",
+    "BadgeDetail",
+    "FuelType",
+    "Transmission",
+    "Price",
+    "Mileage",
+    "FormYear",
+    "Year",
+    "ModifiedDate",
+)
+_WANTED = frozenset(LISTING_FIELDS)
+
+# Выдача отсортирована по дате изменения: изменённое старое объявление может
+# оказаться выше нового, поэтому останавливаемся не на первом просмотренном,
+# а на серии подряд
+SEEN_RUN = 5
+
+_WS = re.compile(r"[ \t\n\r]*")
+
+
+class Listing:
+    """Объявление из выдачи каталога. Читается как словарь (car["Id"],
+    car.get("Price", 0)), но хранит только LISTING_FIELDS."""
+
+    __slots__ = LISTING_FIELDS
+
+    def __init__(self, values):
+        for field in LISTING_FIELDS:
+            setattr(self, field, values.get(field))
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def __getitem__(self, field):
+        value = getattr(self, field, None)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __repr__(self):
+        return f"Listing(Id={self.Id!r}, Model={self.Model!r}, Badge={self.Badge!r})"
+
+
+def listing_version(car):
+    """Ключ версии объявления: меняется при любом изменении на Encar (цена,
+    пробег, повторное размещение), а не только при появлении нового Id."""
+    return f"{car.get('Id')}@{car.get('ModifiedDate')}"
+
+
+def _project(pairs):
+    # Вложенные объекты (фото, опции) превращаются в пустые словари
+    return {key: value for key, value in pairs if key in _WANTED}
+
+
+_decoder = json.JSONDecoder(object_pairs_hook=_project)
+
+
+def _skip(text, pos):
+    return _WS.match(text, pos).end()
+
+
+def _expect(text, pos, char):
+    if text[pos : pos + 1] != char:
+        raise json.JSONDecodeError(f"Ожидался «{char}»", text, pos)
+    return _skip(text, pos + 1)
+
+
+def _separator(text, pos, close):
+    """(позиция, конец): после элемента идёт «,» и следующий элемент или
+    закрывающая скобка close. Висячая и пропущенная запятая — ошибка
+    формата, как у json.loads."""
+    pos = _skip(text, pos)
+    char = text[pos : pos + 1]
+    if char == close:
+        return pos + 1, True
+    if char != ",":
+        raise json.JSONDecodeError(f"Ожидался «,» или «{close}»", text, pos)
+    pos = _skip(text, pos + 1)
+    if text[pos : pos + 1] == close:
+        raise json.JSONDecodeError("Лишняя запятая", text, pos)
+    return pos, False
+
+
+def parse_search_results(text, seen=(), stop_after=SEEN_RUN):
+    """Новые объявления из ответа /api/catalog в порядке выдачи.
+
+    Просмотренные версии (listing_version в seen) в результат не попадают;
+    после stop_after просмотренных подряд остаток ответа не разбирается.
+    Возвращает (объявления, present) — present: Id всех разобранных
+    объявлений, включая просмотренные. Ошибка формата — json.JSONDecodeError.
+    """
+    listings = []
+    present = []
+    pos = _expect(text, _skip(text, 0), "{")
+    done = text[pos : pos + 1] == "}"
+    pos += done
+    while not done:
+        if text[pos : pos + 1] != '"':
+            raise json.JSONDecodeError("Ожидался ключ-строка", text, pos)
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _expect(text, _skip(text, pos), ":")
+        if key != "SearchResults":
+            _, pos = _decoder.raw_decode(text, pos)
+        else:
+            pos = _expect(text, pos, "[")
+            end = text[pos : pos + 1] == "]"
+            pos += end
+            run = 0
+            while not end:
+                values, pos = _decoder.raw_decode(text, pos)
+                if not isinstance(values, dict):
+                    raise json.JSONDecodeError("Ожидался объект", text, pos)
+                car_id = values.get("Id")
+                if car_id is not None:
+                    present.append(car_id)
+                if car_id is not None and listing_version(values) in seen:
+                    run += 1
+                    if run >= stop_after:
+                        return listings, present
+                elif car_id is not None:
+                    run = 0
+                    listings.append(Listing(values))
+                pos, end = _separator(text, pos, "]")
+        pos, done = _separator(text, pos, "}")
+    if _skip(text, pos) != len(text):
+        raise json.JSONDecodeError("Лишние данные после ответа", text, pos)
+    return listings, present
@@ -0,0 +1,107 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Не блокирует поток обработчика: при переполненной очереди запись теряется."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class LazyJson:
+    """Откладывает json.dumps до момента, когда запись действительно выводится."""
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(self.obj, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    """Корневой логгер пишет в очередь, а вывод в stdout идёт из отдельного потока."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.handlers[:] = [DroppingQueueHandler(log_queue)]
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, output, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def file_logger(name, path, max_bytes, backups):
+    """Отдельный логгер в файл с ротацией; запись тоже идёт через очередь."""
+    output = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+    )
+    output.setFormatter(logging.Formatter("%(message)s"))
+    file_queue = queue.Queue(LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(file_queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger(f"kga.file.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.handlers[:] = [DroppingQueueHandler(file_queue)]
+    return logger
+
+
+def get_logger(name):
+    return logging.getLogger(f"kga.{name}")
+
+
+def fields(**values):
+    """extra=fields(user_id=..., action=...) — структурированные поля записи."""
+    return {"fields": values}
@@ -1,15 +1,94 @@
+from startup import startup_timer
+from log import LazyJson, fields, get_logger, setup_logging
+
+import atexit
 import json
+import secrets
+import threading
 import time
-import telebot
 import os
-import requests
 import urllib.parse
-from telebot import types
-from telebot.handler_backends import State, StatesGroup
-from telebot.storage import StateMemoryStorage
-from dotenv import load_dotenv
-from datetime import datetime
-from translations import translations
+from datetime import datetime, timedelta, timezone
+
+with startup_timer.phase("import telebot"):
+    import telebot
+    from telebot import apihelper, types
+    from telebot.handler_backends import State, StatesGroup
+    from telebot.storage import StateMemoryStorage
+with startup_timer.phase("import requests"):
+    import requests
+    import urllib3
+with startup_timer.phase("import dotenv"):
+    from dotenv import load_dotenv
+with startup_timer.phase("import bot modules"):
+    from translator import PhraseTranslator
+    from router import CallbackRouter, callback_data
+    from keyboards import (
+        KeyboardCache,
+        add_alphabet_index,
+        add_page_navigation,
+        alphabet_index,
+        catalog_version,
+        paginate,
+    )
+    from cache import ResponseValidators, SingleFlight, TTLCache
+    from catalog_index import CatalogIndex
+    from history import ListingHistory, SeenVersions
+    from listings import parse_search_results
+    from outbox import Outbox
+    from query import nav_query, query_hash, to_url
+    from scheduler import PollScheduler, Tier
+    from stats import MarketStats
+    from config import (
+        CAPTURE_FILE,
+        CATALOG_CRAWL,
+        CATALOG_CRAWL_DELAY,
+        CATALOG_CRAWL_INTERVAL,
+        CATALOG_CRAWL_RETRIES,
+        CATALOG_CRAWL_RETRY_DELAY,
+        BACKGROUND_QUEUE_SIZE,
+        BACKGROUND_WORKERS,
+        ENCAR_API_URL,
+        HANDLER_QUEUE_SIZE,
+        HANDLER_WORKERS,
+        HISTORY_FILE,
+        MAX_REQUESTS_PER_USER,
+        KEYBOARD_PAGE_SIZE,
+        METRICS_HOST,
+        METRICS_PORT,
+        NAV_CACHE_TTL,
+        OUTBOX_FILE,
+        OUTBOX_MAX_ATTEMPTS,
+        OUTBOX_WORKERS,
+        POLL_BUDGET_PER_MINUTE,
+        POLL_INTERVAL,
+        POLL_WORKERS,
+        PRIORITY_POLL_INTERVAL,
+        PRIORITY_USER_IDS,
+        PRIORITY_WEIGHT,
+        PROXY_BASE_URL,
+        RELIST_AFTER_DAYS,
+        SEEN_FILTER_FILE,
+        SEEN_FILTER_SAVE_INTERVAL,
+        STATS_WINDOW_DAYS,
+        TELEGRAM_API_URL,
+        UPSTREAM_TIMEOUT,
+        WEBHOOK_HOST,
+        WEBHOOK_MAX_CONNECTIONS,
+        WEBHOOK_PORT,
+        WEBHOOK_QUEUE_SIZE,
+        WEBHOOK_SECRET,
+        WEBHOOK_URL,
+        WEBHOOK_WORKERS,
+    )
+    import metrics
+    from tracing import TracingMiddleware, span
+    from capture import capture
+    from webhook import WebhookServer
+    from workers import BoundedWorkerPool
+
+setup_logging()
+logger = get_logger("bot")
 
 # Путь до файла
 REQUESTS_FILE = "requests.json"
@@ -25,7 +104,7 @@ def load_access():
             with open(ACCESS_FILE, "r", encoding="utf-8") as f:
                 return set(json.load(f))
         except Exception as e:
-            print(f"⚠️ Не удалось загрузить access.json: {e}")
+            logger.warning("Не удалось загрузить access.json: %s", e)
             return set()
     return set()
 
@@ -35,32 +114,119 @@ def save_access():
         with open(ACCESS_FILE, "w", encoding="utf-8") as f:
             json.dump(list(ACCESS), f, ensure_ascii=False, indent=2)
     except Exception as e:
-        print(f"⚠️ Ошибка при сохранении access.json: {e}")
+        logger.error("Ошибка при сохранении access.json: %s", e)
 
 
 MANAGER = 604303416  # Только этот пользователь может добавлять других
 
 # Загружаем переменные из .env
-load_dotenv()
+with startup_timer.phase("load .env"):
+    load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 # FSM-хранилище
 state_storage = StateMemoryStorage()
 
+
+def reject_task(func, args, kwargs):
+    # Очередь пула переполнена: сразу отвечаем пользователю, а не копим задачи
+    args = getattr(func, "args", ()) + args
+    update = next(
+        (arg for arg in args if isinstance(arg, (types.CallbackQuery, types.Message))),
+        None,
+    )
+    text = "⏳ Бот сейчас перегружен, повторите через несколько секунд."
+    try:
+        if isinstance(update, types.CallbackQuery):
+            answer_callback(update, text)
+        elif isinstance(update, types.Message):
+            bot.send_message(update.chat.id, text)
+    except Exception as e:
+        logger.warning("Не удалось ответить о перегрузке: %s", e)
+
+
+def answer_callback(call, text=None):
+    # На нажатие можно ответить только один раз: если кнопка уже подтверждена
+    # (например, до медленной загрузки), текст отправляется сообщением
+    try:
+        if getattr(call, "answered", False):
+            if text:
+                bot.send_message(call.message.chat.id, text)
+            return
+        call.answered = True
+        bot.answer_callback_query(call.id, text)
+    except Exception as e:
+        # Устаревший query id не должен ломать обработку самой кнопки
+        logger.warning("Не удалось ответить на нажатие кнопки: %s", e)
+
+
 # Инициализация бота
-bot = telebot.TeleBot(BOT_TOKEN, state_storage=state_storage)
+with startup_timer.phase("init bot"):
+    # Обработчики апдейтов — в своём пуле с ограниченной очередью вместо пула telebot,
+    # медленные маршруты и фоновые задачи — в отдельном пуле
+    bot = telebot.TeleBot(
+        BOT_TOKEN,
+        state_storage=state_storage,
+        use_class_middlewares=True,
+        threaded=False,
+    )
+    bot.threaded = True
+    bot.worker_pool = BoundedWorkerPool(
+        "handlers", HANDLER_WORKERS, HANDLER_QUEUE_SIZE, on_reject=reject_task
+    )
+    background_pool = BoundedWorkerPool(
+        "background",
+        BACKGROUND_WORKERS,
+        BACKGROUND_QUEUE_SIZE,
+        on_reject=reject_task,
+        trace=True,
+    )
+    bot.setup_middleware(TracingMiddleware())
 user_search_data = {}
 
+# Кэш готовых (сериализованных) клавиатур
+keyboard_cache = KeyboardCache()
+
+# Кэш уровней каталога: ключ -> (отсортированный список, версия снимка)
+nav_cache = TTLCache(NAV_CACHE_TTL)
+nav_flight = SingleFlight(on_shared=metrics.NAV_COALESCED.inc)
+
+
+# Маршрутизатор callback-кнопок: действие -> обработчик
+def observe_callback(action, elapsed, failed):
+    metrics.CALLBACK_LATENCY.labels(action).observe(elapsed)
+    if failed:
+        metrics.CALLBACK_ERRORS.labels(action).inc()
+
+
+router = CallbackRouter(
+    observer=observe_callback, executor=background_pool, ack=answer_callback
+)
+
+
+# Единая точка входа для всех callback-запросов
+@bot.callback_query_handler(func=lambda call: True)
+def handle_callback(call):
+    if not router.dispatch(call):
+        answer_callback(call, "⚠️ Кнопка устарела, начните заново.")
+
 
 # Проверка на то может ли человек пользоваться ботом или нет
 def is_authorized(user_id):
     return user_id in ACCESS
 
 
+# Словарь переводов, скомпилированный в дерево для поиска самых длинных совпадений.
+# Загружается лениво (из translations.cache, если он актуален) при первом переводе
+translator = PhraseTranslator()
+
+
 def translate_phrase(phrase):
-    words = phrase.split()
-    translated_words = [translations.get(word, word) for word in words]
-    return " ".join(translated_words)
+    return translator.translate(phrase)
+
+
+# Индекс каталога для inline-поиска, пополняется при каждой загрузке уровня
+catalog_index = CatalogIndex(translate_phrase)
 
 
 def load_requests():
@@ -70,33 +236,38 @@ def load_requests():
             with open(REQUESTS_FILE, "r", encoding="utf-8") as f:
                 user_requests = json.load(f)
         except Exception as e:
-            print(f"⚠️ Не удалось загрузить запросы: {e}")
+            logger.warning("Не удалось загрузить запросы: %s", e)
             user_requests = {}
     else:
         user_requests = {}
 
 
+# Обработчики работают в нескольких потоках, а файл запросов перезаписывается целиком
+requests_file_lock = threading.Lock()
+
+
 def save_requests(new_data):
     global user_requests
     try:
-        if os.path.exists(REQUESTS_FILE):
-            with open(REQUESTS_FILE, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                existing_data = json.loads(content) if content else {}
-        else:
-            existing_data = {}
-
-        for user_id, new_requests in new_data.items():
-            # Убедимся, что user_id — строка
-            user_id_str = str(user_id)
-            existing_data[user_id_str] = new_requests
-
-        user_requests = existing_data  # Обновляем глобальные данные
-
-        with open(REQUESTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(user_requests, f, ensure_ascii=False, indent=2)
+        with requests_file_lock:
+            if os.path.exists(REQUESTS_FILE):
+                with open(REQUESTS_FILE, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                    existing_data = json.loads(content) if content else {}
+            else:
+                existing_data = {}
+
+            for user_id, new_requests in new_data.items():
+                # Убедимся, что user_id — строка
+                user_id_str = str(user_id)
+                existing_data[user_id_str] = new_requests
+
+            user_requests = existing_data  # Обновляем глобальные данные
+
+            with open(REQUESTS_FILE, "w", encoding="utf-8") as f:
+                json.dump(user_requests, f, ensure_ascii=False, indent=2)
     except Exception as e:
-        print(f"⚠️ Ошибка сохранения запросов: {e}")
+        logger.error("Ошибка сохранения запросов: %s", e)
 
 
 # FSM: Состояния формы
@@ -109,11 +280,82 @@ class CarForm(StatesGroup):
     mileage_to = State()
 
 
+# Общая сессия: keep-alive к прокси и Encar и сжатие ответов (gzip, deflate,
+# а при установленном Brotli — ещё и br)
+upstream_session = requests.Session()
+# В пуле соединений на хост место для каждого потока, который ходит к
+# прокси: обработчики, фоновый пул, опрос, отправка уведомлений и обход
+# каталога. Со стандартными 10 лишние соединения закрываются после запроса
+upstream_adapter = requests.adapters.HTTPAdapter(
+    pool_maxsize=HANDLER_WORKERS
+    + WEBHOOK_WORKERS
+    + BACKGROUND_WORKERS
+    + POLL_WORKERS
+    + OUTBOX_WORKERS
+    + 1
+)
+upstream_session.mount("http://", upstream_adapter)
+upstream_session.mount("https://", upstream_adapter)
+upstream_session.headers["Accept-Encoding"] = urllib3.util.make_headers(
+    accept_encoding=True
+)["accept-encoding"]
+
+
+def upstream_get(url, kind, headers=None):
+    # Все запросы к прокси и API Encar идут через эту функцию ради метрик
+    started = time.perf_counter()
+    status = "error"
+    try:
+        with span(f"upstream:{kind}"):
+            response = upstream_session.get(
+                url, headers=headers, timeout=UPSTREAM_TIMEOUT
+            )
+        status = response.status_code
+        # .text декодирует всё тело — только если запись включена
+        if capture.enabled:
+            capture.record_upstream(kind, url, status, response.text)
+        return response
+    finally:
+        metrics.UPSTREAM_LATENCY.labels(kind).observe(time.perf_counter() - started)
+        metrics.UPSTREAM_REQUESTS.labels(kind, status).inc()
+
+
+def telegram_request_sender(method, url, **kwargs):
+    # Подменяет отправку запросов telebot, чтобы мерить вызовы Bot API
+    api_method = url.rsplit("/", 1)[-1]
+    started = time.perf_counter()
+    status = "error"
+    try:
+        with span(f"telegram:{api_method}"):
+            response = apihelper._get_req_session().request(method, url, **kwargs)
+        status = response.status_code
+        if status == 429:
+            metrics.TELEGRAM_RATE_LIMITED.labels(api_method).inc()
+        if capture.enabled and api_method == "getUpdates" and status == 200:
+            for update in response.json().get("result", []):
+                capture.record_update(update)
+        return response
+    finally:
+        metrics.TELEGRAM_LATENCY.labels(api_method).observe(
+            time.perf_counter() - started
+        )
+        metrics.TELEGRAM_REQUESTS.labels(api_method, status).inc()
+
+
+apihelper.CUSTOM_REQUEST_SENDER = telegram_request_sender
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL
+# Словарь меняют потоки обработчиков, поэтому считаем по копии значений
+metrics.ACTIVE_SUBSCRIPTIONS.set_function(
+    lambda: sum(len(requests_) for requests_ in list(user_requests.values()))
+)
+
+
 def get_manufacturers():
-    url = "https://bazarishauto-proxy.onrender.com/api/nav?count=true&q=(And.Hidden.N._.SellType.%EC%9D%BC%EB%B0%98._.CarType.A.)&inav=%7CMetadata%7CSort"
+    url = to_url(nav_query(), PROXY_BASE_URL)
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.get(url, headers=headers)
+        response = upstream_get(url, "nav", headers=headers)
         data = response.json()
         manufacturers = (
             data.get("iNav", {})
@@ -126,15 +368,15 @@ def get_manufacturers():
         manufacturers.sort(key=lambda x: x.get("Metadata", {}).get("EngName", [""])[0])
         return manufacturers
     except Exception as e:
-        print("Ошибка при получении марок:", e)
+        logger.error("Ошибка при получении марок: %s", e)
         return []
 
 
 def get_models_by_brand(manufacturer):
-    url = f"https://bazarishauto-proxy.onrender.com/api/nav?count=true&q=(And.Hidden.N._.SellType.%EC%9D%BC%EB%B0%98._.(C.CarType.A._.Manufacturer.{manufacturer}.))&inav=%7CMetadata%7CSort"
+    url = to_url(nav_query(manufacturer), PROXY_BASE_URL)
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.get(url, headers=headers)
+        response = upstream_get(url, "nav", headers=headers)
         data = response.json()
         all_manufacturers = (
             data.get("iNav", {})
@@ -155,15 +397,15 @@ def get_models_by_brand(manufacturer):
             )
         return []
     except Exception as e:
-        print(f"Ошибка при получении моделей для {manufacturer}:", e)
+        logger.error("Ошибка при получении моделей для %s: %s", manufacturer, e)
         return []
 
 
 def get_generations_by_model(manufacturer, model_group):
-    url = f"https://bazarishauto-proxy.onrender.com/api/nav?count=true&q=(And.Hidden.N._.SellType.%EC%9D%BC%EB%B0%98._.(C.CarType.A._.(C.Manufacturer.{manufacturer}._.ModelGroup.{model_group}.)))&inav=%7CMetadata%7CSort"
+    url = to_url(nav_query(manufacturer, model_group), PROXY_BASE_URL)
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.get(url, headers=headers)
+        response = upstream_get(url, "nav", headers=headers)
         data = response.json()
         all_manufacturers = (
             data.get("iNav", {})
@@ -192,15 +434,20 @@ def get_generations_by_model(manufacturer, model_group):
             selected_model.get("Refinements", {}).get("Nodes", [])[0].get("Facets", [])
         )
     except Exception as e:
-        print(f"Ошибка при получении поколений для {manufacturer}, {model_group}:", e)
+        logger.error(
+            "Ошибка при получении поколений для %s, %s: %s",
+            manufacturer,
+            model_group,
+            e,
+        )
         return []
 
 
 def get_trims_by_generation(manufacturer, model_group, model):
-    url = f"https://bazarishauto-proxy.onrender.com/api/nav?count=true&q=(And.Hidden.N._.(C.CarType.A._.(C.Manufacturer.{manufacturer}._.(C.ModelGroup.{model_group}._.Model.{model}.))))&inav=%7CMetadata%7CSort"
+    url = to_url(nav_query(manufacturer, model_group, model), PROXY_BASE_URL)
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.get(url, headers=headers)
+        response = upstream_get(url, "nav", headers=headers)
         data = response.json()
         all_manufacturers = (
             data.get("iNav", {})
@@ -239,19 +486,17 @@ def get_trims_by_generation(manufacturer, model_group, model):
             selected_model.get("Refinements", {}).get("Nodes", [])[0].get("Facets", [])
         )
     except Exception as e:
-        print(
-            f"Ошибка при получении комплектаций для {manufacturer}, {model_group}, {model}:",
+        logger.error(
+            "Ошибка при получении комплектаций для %s, %s, %s: %s",
+            manufacturer,
+            model_group,
+            model,
             e,
         )
         return []
 
 
-@bot.message_handler(commands=["start"])
-def start_handler(message):
-    if not is_authorized(message.from_user.id):
-        bot.reply_to(message, "❌ У вас нет доступа к этому боту.")
-        return
-
+def build_start_markup():
     # Главные кнопки
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
@@ -285,6 +530,272 @@ def start_handler(message):
     markup.add(
         types.InlineKeyboardButton("🌐 Сайт компании", url="https://kga-korea.com/")
     )
+    return markup
+
+
+def get_catalog_level(key, fetch, *args):
+    cached = nav_cache.get(key)
+    if cached is not None:
+        return cached
+    # Одновременные запросы одного уровня (все нажали одну марку) ждут общий ответ
+    return nav_flight.do(key, load_catalog_level, key, fetch, args)
+
+
+def load_catalog_level(key, fetch, args, touch=True):
+    cached = nav_cache.get(key, touch)
+    if cached is not None:
+        return cached
+    items = fetch(*args)
+    metrics.NAV_FETCHES.inc()
+    if not items:
+        return [], None
+    cached = (items, catalog_version(items))
+    nav_cache.set(key, cached, touch)
+    catalog_index.add_level(key[0], key[1:], items)
+    return cached
+
+
+def crawl_level(key, fetch, *args):
+    # Запрос обхода расходует свободный бюджет прокси (см. take_spare), а
+    # пустой ответ повторяется с растущей паузой. Бюджет ждём до запроса, а не
+    # внутри него: иначе ждал бы и пользователь, попавший на тот же уровень.
+    # Кэш навигации обход читает и пополняет с touch=False, чтобы проход по
+    # всему дереву не вытеснял уровни, которые сейчас листают пользователи
+    delay = CATALOG_CRAWL_RETRY_DELAY
+    for attempt in range(CATALOG_CRAWL_RETRIES):
+        cached = nav_cache.get(key, touch=False)
+        if cached is None:
+            poll_scheduler.take_spare()
+            cached = nav_flight.do(key, load_catalog_level, key, fetch, args, False)
+        items, _ = cached
+        time.sleep(CATALOG_CRAWL_DELAY)
+        if items:
+            return items
+        if attempt + 1 < CATALOG_CRAWL_RETRIES:
+            time.sleep(delay)
+            delay *= 2
+    logger.warning("Уровень каталога %s пуст, пропускаем", "/".join(key))
+    return []
+
+
+def crawl_catalog_pass():
+    # Один обход дерева; False — не удалось получить даже список марок
+    manufacturers = crawl_level(("brands",), get_manufacturers)
+    for brand in manufacturers:
+        brand_kr = brand.get("DisplayValue", "")
+        models = crawl_level(("models", brand_kr), get_models_by_brand, brand_kr)
+        for model in models:
+            model_kr = model.get("DisplayValue", "")
+            generations = crawl_level(
+                ("generations", brand_kr, model_kr),
+                get_generations_by_model,
+                brand_kr,
+                model_kr,
+            )
+            for generation in generations:
+                generation_kr = generation.get("DisplayValue", "")
+                crawl_level(
+                    ("trims", brand_kr, model_kr, generation_kr),
+                    get_trims_by_generation,
+                    brand_kr,
+                    model_kr,
+                    generation_kr,
+                )
+    return bool(manufacturers)
+
+
+def crawl_catalog():
+    # Фоновый обход всего дерева каталога, чтобы inline-поиск знал все
+    # комплектации. Неудачный обход повторяется через растущую паузу, а не
+    # через CATALOG_CRAWL_INTERVAL
+    failures = 0
+    while True:
+        started = time.time()
+        try:
+            complete = crawl_catalog_pass()
+        except Exception as e:
+            logger.exception("Ошибка обхода каталога: %s", e)
+            complete = False
+        if complete:
+            failures = 0
+            logger.info(
+                "Индекс каталога обновлён: %d комплектаций за %.0f с",
+                len(catalog_index),
+                time.time() - started,
+            )
+            time.sleep(CATALOG_CRAWL_INTERVAL)
+        else:
+            failures += 1
+            time.sleep(
+                min(
+                    CATALOG_CRAWL_INTERVAL,
+                    CATALOG_CRAWL_RETRY_DELAY * 2 ** min(failures, 16),
+                )
+            )
+
+
+def brand_eng_name(item):
+    return item.get("Metadata", {}).get("EngName", [""])[0]
+
+
+def build_brands_markup(manufacturers, page=0):
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    items, page, pages = paginate(manufacturers, page, KEYBOARD_PAGE_SIZE)
+    for item in items:
+        kr_name = item.get("DisplayValue", "Без названия")
+        eng_name = item.get("Metadata", {}).get("EngName", [""])[0]
+        button_data = callback_data("brand", eng_name, kr_name)
+        display_text = f"{eng_name}"
+        markup.add(types.InlineKeyboardButton(display_text, callback_data=button_data))
+    add_page_navigation(markup, page, pages, "brands_page")
+    if pages > 1:
+        index = alphabet_index(manufacturers, brand_eng_name, KEYBOARD_PAGE_SIZE)
+        add_alphabet_index(markup, index, "brands_page")
+    return markup
+
+
+def build_models_markup(models, page=0):
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    items, page, pages = paginate(models, page, KEYBOARD_PAGE_SIZE)
+    for item in items:
+        model_kr = item.get("DisplayValue", "Без названия")
+        model_eng = item.get("Metadata", {}).get("EngName", [""])[0]
+        button_data = callback_data("model", model_eng, model_kr)
+        display_text = f"{model_eng}"
+        markup.add(types.InlineKeyboardButton(display_text, callback_data=button_data))
+    add_page_navigation(markup, page, pages, "models_page")
+    return markup
+
+
+def format_generation_date(date_str):
+    if len(date_str) == 6:
+        return f"{date_str[4:6]}.{date_str[0:4]}"
+    return ""
+
+
+def generation_years(metadata):
+    # Годы выпуска поколения по датам начала и окончания из метаданных nav
+    start_raw = str(metadata.get("ModelStartDate", [""])[0])
+    end_raw = str(metadata.get("ModelEndDate", [""])[0] or "")
+
+    current_year = datetime.now().year
+    start_year = int(start_raw[:4]) if len(start_raw) == 6 else current_year - 10
+    if end_raw and end_raw.isdigit():
+        end_year = int(end_raw[:4])
+    else:
+        end_year = current_year
+    return start_year, end_year
+
+
+def build_generations_markup(generations):
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    for item in generations:
+        gen_kr = item.get("DisplayValue", "Без названия")
+        gen_eng = item.get("Metadata", {}).get("EngName", [""])[0]
+
+        start_raw = str(item.get("Metadata", {}).get("ModelStartDate", [""])[0])
+        end_raw = str(item.get("Metadata", {}).get("ModelEndDate", [""])[0])
+
+        start_date = format_generation_date(start_raw)
+        end_date = format_generation_date(end_raw) if len(end_raw) > 0 else "н.в."
+
+        period = f"({start_date} — {end_date})" if start_date else ""
+
+        button_data = callback_data("generation", gen_eng, gen_kr)
+        translated_gen_kr = translate_phrase(gen_kr)
+        translated_gen_eng = translate_phrase(gen_eng)
+        display_text = f"{translated_gen_kr} {translated_gen_eng} {period}".strip()
+        markup.add(types.InlineKeyboardButton(display_text, callback_data=button_data))
+    return markup
+
+
+def build_trims_markup(trims, page=0):
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    items, page, pages = paginate(trims, page, KEYBOARD_PAGE_SIZE)
+    for item in items:
+        trim_kr = item.get("DisplayValue", "")
+        trim_eng = item.get("Metadata", {}).get("EngName", [""])[0]
+        button_data = callback_data("trim", trim_eng, trim_kr)
+        display_text = trim_kr
+        markup.add(types.InlineKeyboardButton(display_text, callback_data=button_data))
+    add_page_navigation(markup, page, pages, "trims_page")
+    return markup
+
+
+def build_year_from_markup(start_year, end_year):
+    year_markup = types.InlineKeyboardMarkup(row_width=4)
+    for y in range(start_year, end_year + 1):
+        year_markup.add(
+            types.InlineKeyboardButton(
+                str(y), callback_data=callback_data("year_from", y)
+            )
+        )
+    return year_markup
+
+
+def build_year_to_markup(year_from, last_year):
+    year_markup = types.InlineKeyboardMarkup(row_width=4)
+    for y in range(year_from, last_year + 1):
+        year_markup.add(
+            types.InlineKeyboardButton(
+                str(y), callback_data=callback_data("year_to", year_from, y)
+            )
+        )
+    return year_markup
+
+
+def build_mileage_from_markup():
+    mileage_markup = types.InlineKeyboardMarkup(row_width=4)
+    for value in range(0, 200001, 10000):
+        mileage_markup.add(
+            types.InlineKeyboardButton(
+                f"{value} км", callback_data=callback_data("mileage_from", value)
+            )
+        )
+    return mileage_markup
+
+
+def build_mileage_to_markup(mileage_from):
+    mileage_markup = types.InlineKeyboardMarkup(row_width=4)
+    for value in range(mileage_from + 10000, 200001, 10000):
+        mileage_markup.add(
+            types.InlineKeyboardButton(
+                f"{value} км",
+                callback_data=callback_data("mileage_to", mileage_from, value),
+            )
+        )
+    return mileage_markup
+
+
+def build_next_action_markup():
+    # Кнопки после добавления авто в поиск и под уведомлениями
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    markup.add(
+        types.InlineKeyboardButton(
+            "➕ Добавить новый автомобиль в поиск", callback_data="search_car"
+        )
+    )
+    markup.add(
+        types.InlineKeyboardButton("🏠 Вернуться в главное меню", callback_data="start")
+    )
+    return markup
+
+
+@bot.message_handler(commands=["start"])
+def start_handler(message):
+    if not is_authorized(message.from_user.id):
+        bot.reply_to(message, "❌ У вас нет доступа к этому боту.")
+        return
+
+    markup = keyboard_cache.get("start", (), build_start_markup)
+
+    # /start от чата с приостановленными подписками (разблокировал бота или
+    # снова получил доступ) возобновляет их
+    resumed = poll_scheduler.resume(message.chat.id)
+    if poll_scheduler.resume(message.from_user.id) or resumed:
+        bot.send_message(
+            message.chat.id, "🔔 Уведомления по вашим запросам снова включены."
+        )
 
     welcome_text = (
         "👋 Добро пожаловать бот от *KGA Korea*!\n\n"
@@ -324,12 +835,12 @@ def process_user_id_input(message):
         bot.send_message(message.chat.id, "⚠️ Введите корректный числовой ID.")
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "start")
+@router.route("start")
 def handle_start_callback(call):
     start_handler(call.message)
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "my_requests")
+@router.route("my_requests")
 def handle_my_requests(call):
     user_id = call.from_user.id
     if not is_authorized(user_id):
@@ -348,7 +859,7 @@ def handle_my_requests(call):
         car_name = f"{req['manufacturer']} {req['model']}"
         markup.add(
             types.InlineKeyboardButton(
-                f"❌ {car_name}", callback_data=f"delete_request_{idx}"
+                f"❌ {car_name}", callback_data=callback_data("delete_request", idx)
             )
         )
     markup.add(
@@ -370,20 +881,21 @@ def handle_my_requests(call):
     bot.send_message(call.message.chat.id, text, reply_markup=markup)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_request_"))
-def handle_delete_request(call):
+@router.route("delete_request", args=1)
+def handle_delete_request(call, index):
     if not is_authorized(call.from_user.id):
         bot.send_message(call.message.chat.id, "❌ У вас нет доступа к боту.")
         return
 
     user_id = str(call.from_user.id)
-    index = int(call.data.split("_")[-1])
+    index = int(index)
 
     if user_id in user_requests and 0 <= index < len(user_requests[user_id]):
         deleted_req = user_requests[user_id].pop(index)
         save_requests(user_requests)
+        poll_scheduler.remove(int(user_id), deleted_req)
 
-        bot.answer_callback_query(call.id, "✅ Запрос удалён.")
+        answer_callback(call, "✅ Запрос удалён.")
 
         # Обновляем список запросов
         if not user_requests[user_id]:
@@ -399,7 +911,7 @@ def handle_delete_request(call):
             car_name = f"{req['manufacturer']} {req['model']}"
             markup.add(
                 types.InlineKeyboardButton(
-                    f"❌ {car_name}", callback_data=f"delete_request_{idx}"
+                    f"❌ {car_name}", callback_data=callback_data("delete_request", idx)
                 )
             )
         markup.add(
@@ -427,10 +939,10 @@ def handle_delete_request(call):
             reply_markup=markup,
         )
     else:
-        bot.answer_callback_query(call.id, "⚠️ Запрос не найден.")
+        answer_callback(call, "⚠️ Запрос не найден.")
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "delete_all_requests")
+@router.route("delete_all_requests")
 def handle_delete_all_requests(call):
     if not is_authorized(call.from_user.id):
         bot.send_message(call.message.chat.id, "❌ У вас нет доступа к боту.")
@@ -440,6 +952,7 @@ def handle_delete_all_requests(call):
     if user_id in user_requests:
         user_requests[user_id] = []
         save_requests(user_requests)
+        poll_scheduler.remove(int(user_id))
 
         markup = types.InlineKeyboardMarkup(row_width=1)
         markup.add(
@@ -454,50 +967,43 @@ def handle_delete_all_requests(call):
             call.message.message_id,
             reply_markup=markup,
         )
-        bot.answer_callback_query(call.id, "✅ Все запросы удалены.")
+        answer_callback(call, "✅ Все запросы удалены.")
     else:
-        bot.answer_callback_query(call.id, "⚠️ У вас нет сохранённых запросов.")
+        answer_callback(call, "⚠️ У вас нет сохранённых запросов.")
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "search_car")
+@router.route("search_car", background=True)
 def handle_search_car(call):
-    manufacturers = get_manufacturers()
+    if request_limit_reached(call.from_user.id):
+        bot.send_message(call.message.chat.id, REQUEST_LIMIT_TEXT)
+        return
+
+    manufacturers, version = get_catalog_level(("brands",), get_manufacturers)
     if not manufacturers:
-        bot.answer_callback_query(call.id, "Не удалось загрузить марки.")
+        answer_callback(call, "Не удалось загрузить марки.")
         return
 
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    for item in manufacturers:  # Удалено ограничение [:10]
-        kr_name = item.get("DisplayValue", "Без названия")
-        eng_name = item.get("Metadata", {}).get("EngName", [""])[0]
-        callback_data = f"brand_{eng_name}_{kr_name}"
-        display_text = f"{eng_name}"
-        markup.add(
-            types.InlineKeyboardButton(display_text, callback_data=callback_data)
-        )
+    markup = keyboard_cache.get(
+        "brands", (0,), lambda: build_brands_markup(manufacturers), version
+    )
 
     bot.send_message(
         call.message.chat.id, "Выбери марку автомобиля:", reply_markup=markup
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("brand_"))
-def handle_brand_selection(call):
-    _, eng_name, kr_name = call.data.split("_", 2)
-    models = get_models_by_brand(kr_name)
+@router.route("brand", args=2, background=True)
+def handle_brand_selection(call, eng_name, kr_name):
+    models, version = get_catalog_level(
+        ("models", kr_name), get_models_by_brand, kr_name
+    )
     if not models:
-        bot.answer_callback_query(call.id, "Не удалось загрузить модели.")
+        answer_callback(call, "Не удалось загрузить модели.")
         return
 
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    for item in models:
-        model_kr = item.get("DisplayValue", "Без названия")
-        model_eng = item.get("Metadata", {}).get("EngName", [""])[0]
-        callback_data = f"model_{model_eng}_{model_kr}"
-        display_text = f"{model_eng}"
-        markup.add(
-            types.InlineKeyboardButton(display_text, callback_data=callback_data)
-        )
+    markup = keyboard_cache.get(
+        "models", (kr_name, 0), lambda: build_models_markup(models), version
+    )
 
     bot.edit_message_text(
         f"Марка: {eng_name} ({kr_name})\nТеперь выбери модель:",
@@ -507,9 +1013,8 @@ def handle_brand_selection(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("model_"))
-def handle_model_selection(call):
-    _, model_eng, model_kr = call.data.split("_", 2)
+@router.route("model", args=2, background=True)
+def handle_model_selection(call, model_eng, model_kr):
     message_text = call.message.text
     # Получаем марку из предыдущего текста сообщения
     brand_line = next(
@@ -523,36 +1028,22 @@ def handle_model_selection(call):
         brand_eng = brand_part
         brand_kr = ""
 
-    generations = get_generations_by_model(brand_kr, model_kr)
+    generations, version = get_catalog_level(
+        ("generations", brand_kr, model_kr),
+        get_generations_by_model,
+        brand_kr,
+        model_kr,
+    )
     if not generations:
-        bot.answer_callback_query(call.id, "Не удалось загрузить поколения.")
+        answer_callback(call, "Не удалось загрузить поколения.")
         return
 
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    for item in generations:
-        gen_kr = item.get("DisplayValue", "Без названия")
-        gen_eng = item.get("Metadata", {}).get("EngName", [""])[0]
-
-        start_raw = str(item.get("Metadata", {}).get("ModelStartDate", [""])[0])
-        end_raw = str(item.get("Metadata", {}).get("ModelEndDate", [""])[0])
-
-        def format_date(date_str):
-            if len(date_str) == 6:
-                return f"{date_str[4:6]}.{date_str[0:4]}"
-            return ""
-
-        start_date = format_date(start_raw)
-        end_date = format_date(end_raw) if len(end_raw) > 0 else "н.в."
-
-        period = f"({start_date} — {end_date})" if start_date else ""
-
-        callback_data = f"generation_{gen_eng}_{gen_kr}"
-        translated_gen_kr = translate_phrase(gen_kr)
-        translated_gen_eng = translate_phrase(gen_eng)
-        display_text = f"{translated_gen_kr} {translated_gen_eng} {period}".strip()
-        markup.add(
-            types.InlineKeyboardButton(display_text, callback_data=callback_data)
-        )
+    markup = keyboard_cache.get(
+        "generations",
+        (brand_kr, model_kr),
+        lambda: build_generations_markup(generations),
+        version,
+    )
 
     bot.edit_message_text(
         f"Марка: {brand_eng.strip()} ({brand_kr})\nМодель: {model_eng} ({model_kr})\nТеперь выбери поколение:",
@@ -562,9 +1053,8 @@ def handle_model_selection(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("generation_"))
-def handle_generation_selection(call):
-    _, generation_eng, generation_kr = call.data.split("_", 2)
+@router.route("generation", args=2, background=True)
+def handle_generation_selection(call, generation_eng, generation_kr):
     message_text = call.message.text
 
     brand_line = next(
@@ -585,7 +1075,12 @@ def handle_generation_selection(call):
         model_kr = ""
 
     # Получаем поколения для определения дат
-    generations = get_generations_by_model(brand_kr, model_kr)
+    generations, _ = get_catalog_level(
+        ("generations", brand_kr, model_kr),
+        get_generations_by_model,
+        brand_kr,
+        model_kr,
+    )
     selected_generation = next(
         (
             g
@@ -598,55 +1093,37 @@ def handle_generation_selection(call):
     )
 
     if not selected_generation:
-        bot.answer_callback_query(call.id, "Не удалось определить поколение.")
+        answer_callback(call, "Не удалось определить поколение.")
         return
 
-    # Получаем даты начала и окончания поколения
-    start_raw = str(
-        selected_generation.get("Metadata", {}).get("ModelStartDate", [""])[0]
-    )
-    end_raw = str(
-        selected_generation.get("Metadata", {}).get("ModelEndDate", [""])[0] or ""
-    )
-
-    current_year = datetime.now().year
-
-    # Определяем начальный и конечный год
-    raw_start_year = int(start_raw[:4]) if len(start_raw) == 6 else current_year - 10
-
     # Используем точный год начала поколения без смещения
-    start_year = raw_start_year
+    start_year, end_year = generation_years(selected_generation.get("Metadata", {}))
 
-    if end_raw and end_raw.isdigit():
-        end_year = int(end_raw[:4])
-    else:
-        end_year = current_year
-
-    # --- DEBUGGING --- Выводим полученные даты и рассчитанные годы
-    print(f"⚙️ DEBUG [handle_generation_selection] - Raw start_raw: '{start_raw}'")
-    print(f"⚙️ DEBUG [handle_generation_selection] - Raw end_raw: '{end_raw}'")
-    print(
-        f"⚙️ DEBUG [handle_generation_selection] - Original API start_year: {raw_start_year}"
+    logger.debug(
+        "Годы поколения: %s-%s",
+        start_year,
+        end_year,
+        extra=fields(handler="generation", user_id=call.from_user.id),
     )
-    print(f"⚙️ DEBUG [handle_generation_selection] - Used year_from: {start_year}")
-    print(f"⚙️ DEBUG [handle_generation_selection] - Calculated year_to: {end_year}")
-    # --- END DEBUGGING ---
 
     # Получаем комплектации
-    trims = get_trims_by_generation(brand_kr, model_kr, generation_kr)
+    trims, version = get_catalog_level(
+        ("trims", brand_kr, model_kr, generation_kr),
+        get_trims_by_generation,
+        brand_kr,
+        model_kr,
+        generation_kr,
+    )
     if not trims:
-        bot.answer_callback_query(call.id, "Не удалось загрузить комплектации.")
+        answer_callback(call, "Не удалось загрузить комплектации.")
         return
 
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    for item in trims:
-        trim_kr = item.get("DisplayValue", "")
-        trim_eng = item.get("Metadata", {}).get("EngName", [""])[0]
-        callback_data = f"trim_{trim_eng}_{trim_kr}"
-        display_text = trim_kr
-        markup.add(
-            types.InlineKeyboardButton(display_text, callback_data=callback_data)
-        )
+    markup = keyboard_cache.get(
+        "trims",
+        (brand_kr, model_kr, generation_kr, 0),
+        lambda: build_trims_markup(trims),
+        version,
+    )
 
     user_id = call.from_user.id
     if user_id not in user_search_data:
@@ -671,15 +1148,79 @@ def handle_generation_selection(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("trim_"))
-def handle_trim_selection(call):
-    parts = call.data.split("_", 2)
-    trim_eng = parts[1]
-    trim_kr = parts[2] if len(parts) > 2 else parts[1]
+@router.route("noop")
+def handle_noop(call):
+    answer_callback(call)
 
-    print(f"✅ DEBUG trim selection - raw data:")
-    print(f"trim_eng: {trim_eng}")
-    print(f"trim_kr: {trim_kr}")
+
+@router.route("brands_page", args=1, background=True)
+def handle_brands_page(call, page):
+    page = int(page)
+    manufacturers, version = get_catalog_level(("brands",), get_manufacturers)
+    if not manufacturers:
+        answer_callback(call, "Не удалось загрузить марки.")
+        return
+
+    markup = keyboard_cache.get(
+        "brands", (page,), lambda: build_brands_markup(manufacturers, page), version
+    )
+    bot.edit_message_reply_markup(
+        call.message.chat.id, call.message.message_id, reply_markup=markup
+    )
+    answer_callback(call)
+
+
+@router.route("models_page", args=1, background=True)
+def handle_models_page(call, page):
+    page = int(page)
+    # Марку берём из текста сообщения, как и при выборе модели
+    brand_line = next(
+        (line for line in call.message.text.split("\n") if "Марка:" in line), ""
+    )
+    brand_kr = brand_line.rsplit(" (", 1)[-1].rstrip(")") if " (" in brand_line else ""
+    models, version = get_catalog_level(
+        ("models", brand_kr), get_models_by_brand, brand_kr
+    )
+    if not models:
+        answer_callback(call, "Не удалось загрузить модели.")
+        return
+
+    markup = keyboard_cache.get(
+        "models", (brand_kr, page), lambda: build_models_markup(models, page), version
+    )
+    bot.edit_message_reply_markup(
+        call.message.chat.id, call.message.message_id, reply_markup=markup
+    )
+    answer_callback(call)
+
+
+@router.route("trims_page", args=1, background=True)
+def handle_trims_page(call, page):
+    page = int(page)
+    # Марка, модель и поколение сохранены при выборе поколения
+    user_data = user_search_data.get(call.from_user.id, {})
+    key = (
+        user_data.get("manufacturer", ""),
+        user_data.get("model_group", ""),
+        user_data.get("model", ""),
+    )
+    trims, version = get_catalog_level(("trims",) + key, get_trims_by_generation, *key)
+    if not trims:
+        answer_callback(call, "Не удалось загрузить комплектации.")
+        return
+
+    markup = keyboard_cache.get(
+        "trims", key + (page,), lambda: build_trims_markup(trims, page), version
+    )
+    bot.edit_message_reply_markup(
+        call.message.chat.id, call.message.message_id, reply_markup=markup
+    )
+    answer_callback(call)
+
+
+@router.route("trim", args=2)
+def handle_trim_selection(call, trim_eng, trim_kr):
+    trim_kr = trim_kr or trim_eng
 
     user_id = call.from_user.id
     if user_id not in user_search_data:
@@ -689,26 +1230,22 @@ def handle_trim_selection(call):
     start_year = user_search_data[user_id].get("year_from", datetime.now().year - 10)
     end_year = user_search_data[user_id].get("year_to", datetime.now().year)
 
-    # --- DEBUGGING --- Добавим вывод для проверки значений годов
-    print(
-        f"⚙️ DEBUG [handle_trim_selection] - User {user_id} - Retrieved year_from: {start_year}"
-    )
-    print(
-        f"⚙️ DEBUG [handle_trim_selection] - User {user_id} - Retrieved year_to: {end_year}"
-    )
-    # --- END DEBUGGING ---
-
     # Сохраняем trim
     user_search_data[user_id]["trim"] = trim_kr.strip()
 
-    print(f"✅ DEBUG user_search_data after trim selection:")
-    print(json.dumps(user_search_data[user_id], indent=2, ensure_ascii=False))
+    logger.debug(
+        "Выбрана комплектация %s (%s), данные поиска: %s",
+        trim_eng,
+        trim_kr,
+        LazyJson(user_search_data[user_id]),
+        extra=fields(handler="trim", user_id=user_id),
+    )
 
-    year_markup = types.InlineKeyboardMarkup(row_width=4)
-    for y in range(start_year, end_year + 1):
-        year_markup.add(
-            types.InlineKeyboardButton(str(y), callback_data=f"year_from_{y}")
-        )
+    year_markup = keyboard_cache.get(
+        "year_from",
+        (start_year, end_year),
+        lambda: build_year_from_markup(start_year, end_year),
+    )
 
     message_text = call.message.text
     brand_line = next(
@@ -748,9 +1285,9 @@ def handle_trim_selection(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("year_from_"))
-def handle_year_from_selection(call):
-    year_from = int(call.data.split("_")[2])
+@router.route("year_from", args=1)
+def handle_year_from_selection(call, year_from):
+    year_from = int(year_from)
     user_id = call.from_user.id
     if user_id not in user_search_data:
         user_search_data[user_id] = {}
@@ -758,15 +1295,18 @@ def handle_year_from_selection(call):
     # Сохраняем год начала, сохраняя остальные данные
     user_search_data[user_id].update({"year_from": year_from})
 
-    print(f"✅ DEBUG user_search_data after year_from selection:")
-    print(json.dumps(user_search_data[user_id], indent=2, ensure_ascii=False))
+    logger.debug(
+        "Данные поиска после выбора начального года: %s",
+        LazyJson(user_search_data[user_id]),
+        extra=fields(handler="year_from", user_id=user_id),
+    )
 
-    current_year = datetime.now().year
-    year_markup = types.InlineKeyboardMarkup(row_width=4)
-    for y in range(year_from, current_year + 2):  # +2 для учета будущего года
-        year_markup.add(
-            types.InlineKeyboardButton(str(y), callback_data=f"year_to_{year_from}_{y}")
-        )
+    last_year = datetime.now().year + 1  # +1 для учета будущего года
+    year_markup = keyboard_cache.get(
+        "year_to",
+        (year_from, last_year),
+        lambda: build_year_to_markup(year_from, last_year),
+    )
 
     bot.edit_message_text(
         f"Начальный год: {year_from}\nТеперь выберите конечный год:",
@@ -776,10 +1316,10 @@ def handle_year_from_selection(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("year_to_"))
-def handle_year_to_selection(call):
-    year_from = int(call.data.split("_")[2])
-    year_to = int(call.data.split("_")[3])
+@router.route("year_to", args=2)
+def handle_year_to_selection(call, year_from, year_to):
+    year_from = int(year_from)
+    year_to = int(year_to)
     user_id = call.from_user.id
     if user_id not in user_search_data:
         user_search_data[user_id] = {}
@@ -787,16 +1327,13 @@ def handle_year_to_selection(call):
     # Сохраняем год окончания, сохраняя остальные данные
     user_search_data[user_id].update({"year_to": year_to})
 
-    print(f"✅ DEBUG user_search_data after year_to selection:")
-    print(json.dumps(user_search_data[user_id], indent=2, ensure_ascii=False))
+    logger.debug(
+        "Данные поиска после выбора конечного года: %s",
+        LazyJson(user_search_data[user_id]),
+        extra=fields(handler="year_to", user_id=user_id),
+    )
 
-    mileage_markup = types.InlineKeyboardMarkup(row_width=4)
-    for value in range(0, 200001, 10000):
-        mileage_markup.add(
-            types.InlineKeyboardButton(
-                f"{value} км", callback_data=f"mileage_from_{value}"
-            )
-        )
+    mileage_markup = keyboard_cache.get("mileage_from", (), build_mileage_from_markup)
 
     bot.edit_message_text(
         f"Диапазон годов: {year_from}-{year_to}\nТеперь выберите минимальный пробег:",
@@ -806,24 +1343,21 @@ def handle_year_to_selection(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("mileage_from_"))
-def handle_mileage_from(call):
-    mileage_from = int(call.data.split("_")[2])
+@router.route("mileage_from", args=1)
+def handle_mileage_from(call, mileage_from):
+    mileage_from = int(mileage_from)
 
-    print(f"✅ DEBUG user_search_data before mileage_from selection:")
-    print(
-        json.dumps(
-            user_search_data.get(call.from_user.id, {}), indent=2, ensure_ascii=False
-        )
+    logger.debug(
+        "Данные поиска перед выбором минимального пробега: %s",
+        LazyJson(user_search_data.get(call.from_user.id, {})),
+        extra=fields(handler="mileage_from", user_id=call.from_user.id),
     )
 
-    mileage_markup = types.InlineKeyboardMarkup(row_width=4)
-    for value in range(mileage_from + 10000, 200001, 10000):
-        mileage_markup.add(
-            types.InlineKeyboardButton(
-                f"{value} км", callback_data=f"mileage_to_{mileage_from}_{value}"
-            )
-        )
+    mileage_markup = keyboard_cache.get(
+        "mileage_to",
+        (mileage_from,),
+        lambda: build_mileage_to_markup(mileage_from),
+    )
 
     bot.send_message(
         call.message.chat.id,
@@ -832,16 +1366,15 @@ def handle_mileage_from(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("mileage_to_"))
-def handle_mileage_to(call):
-    mileage_from = int(call.data.split("_")[2])
-    mileage_to = int(call.data.split("_")[3])
+@router.route("mileage_to", args=2)
+def handle_mileage_to(call, mileage_from, mileage_to):
+    mileage_from = int(mileage_from)
+    mileage_to = int(mileage_to)
 
-    print(f"✅ DEBUG user_search_data before mileage_to selection:")
-    print(
-        json.dumps(
-            user_search_data.get(call.from_user.id, {}), indent=2, ensure_ascii=False
-        )
+    logger.debug(
+        "Данные поиска перед выбором максимального пробега: %s",
+        LazyJson(user_search_data.get(call.from_user.id, {})),
+        extra=fields(handler="mileage_to", user_id=call.from_user.id),
     )
 
     user_id = call.from_user.id
@@ -859,7 +1392,11 @@ def handle_mileage_to(call):
     missing_fields = [field for field in required_fields if field not in user_data]
 
     if missing_fields:
-        print(f"❌ Отсутствуют необходимые поля: {missing_fields}")
+        logger.warning(
+            "Отсутствуют необходимые поля: %s",
+            missing_fields,
+            extra=fields(handler="mileage_to", user_id=user_id),
+        )
         bot.send_message(
             call.message.chat.id,
             "⚠️ Произошла ошибка: не все данные были сохранены. Пожалуйста, начните поиск заново.",
@@ -873,15 +1410,36 @@ def handle_mileage_to(call):
     year_from = user_data["year_from"]
     year_to = user_data["year_to"]
 
-    print("⚙️ Данные для поиска:")
-    print(f"manufacturer: {manufacturer}")
-    print(f"model_group: {model_group}")
-    print(f"model: {model}")
-    print(f"trim: {trim}")
-    print(f"year_from: {year_from}")
-    print(f"year_to: {year_to}")
-    print(f"mileage_from: {mileage_from}")
-    print(f"mileage_to: {mileage_to}")
+    logger.info(
+        "Новый запрос поиска: %s %s %s %s, годы %s-%s, пробег %s-%s",
+        manufacturer,
+        model_group,
+        model,
+        trim,
+        year_from,
+        year_to,
+        mileage_from,
+        mileage_to,
+        extra=fields(handler="mileage_to", user_id=user_id),
+    )
+
+    saved = add_search_request(
+        call.message.chat.id,
+        user_id,
+        {
+            "manufacturer": manufacturer,
+            "model_group": model_group,
+            "model": model,
+            "trim": trim,
+            "year_from": year_from,
+            "year_to": year_to,
+            "mileage_from": mileage_from,
+            "mileage_to": mileage_to,
+        },
+    )
+    if not saved:
+        bot.send_message(call.message.chat.id, REQUEST_LIMIT_TEXT)
+        return
 
     bot.send_message(
         call.message.chat.id,
@@ -889,25 +1447,124 @@ def handle_mileage_to(call):
     )
 
     # Кнопки после завершения добавления авто
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    markup.add(
-        types.InlineKeyboardButton(
-            "➕ Добавить новый автомобиль в поиск", callback_data="search_car"
-        )
-    )
-    markup.add(
-        types.InlineKeyboardButton("🏠 Вернуться в главное меню", callback_data="start")
-    )
+    markup = keyboard_cache.get("next_action", (), build_next_action_markup)
     bot.send_message(
         call.message.chat.id,
         "Хотите добавить ещё один автомобиль в поиск или вернуться в главное меню?",
         reply_markup=markup,
     )
 
-    if user_id not in user_requests:
-        user_requests[user_id] = []
 
-    user_requests[user_id].append(
+REQUEST_LIMIT_TEXT = (
+    f"⚠️ У вас уже {MAX_REQUESTS_PER_USER} сохранённых запросов — это максимум. "
+    "Удалите ненужные в «📋 Список моих запросов»."
+)
+
+
+def request_limit_reached(user_id):
+    return bool(MAX_REQUESTS_PER_USER) and (
+        len(user_requests.get(str(user_id), [])) >= MAX_REQUESTS_PER_USER
+    )
+
+
+def schedule_saved_requests():
+    # После перезапуска сохранённые запросы снова опрашиваются: без этого
+    # outbox, история и фильтр просмотренных ничего не дали бы между запусками
+    scheduled = 0
+    for user_id, searches in list(user_requests.items()):
+        for search in searches:
+            try:
+                poll_scheduler.add(int(user_id), search)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(
+                    "Сохранённый запрос не поставлен в опрос: %r",
+                    e,
+                    extra=fields(user_id=user_id),
+                )
+                continue
+            scheduled += 1
+    return scheduled
+
+
+def add_search_request(chat_id, user_id, search):
+    # False — достигнут лимит запросов пользователя, запрос не сохранён
+    if request_limit_reached(user_id):
+        return False
+    # Запрос может быть сохранён из группы: уведомления идут в тот же чат
+    search = {**search, "chat_id": chat_id}
+    # Ключи в requests.json — строки, приводим user_id к тому же виду
+    user_requests.setdefault(str(user_id), []).append(search)
+    save_requests(user_requests)
+
+    # Новый запрос — признак живого чата и пользователя с доступом
+    poll_scheduler.resume(chat_id)
+    poll_scheduler.resume(user_id)
+    poll_scheduler.add(user_id, search)
+    return True
+
+
+def describe_catalog_path(path):
+    # "Hyundai Grandeur — 그랜저 (GN7) · 가솔린 2WD" по пути из корейских названий
+    names = []
+    for depth in range(1, len(path)):
+        node = catalog_index.node(path[:depth]) or {}
+        names.append(node.get("eng_name") or path[depth - 1])
+    return f"{' '.join(names[:2])} — {path[2]} · {path[3]}"
+
+
+@bot.inline_handler(func=lambda query: True)
+def handle_inline_search(inline_query):
+    if not is_authorized(inline_query.from_user.id):
+        bot.answer_inline_query(inline_query.id, [], cache_time=60, is_personal=True)
+        return
+
+    results = []
+    for doc_id, path, _ in catalog_index.search(inline_query.query, limit=20):
+        generation = catalog_index.node(path[:3]) or {}
+        year_from, year_to = generation_years(generation.get("metadata", {}))
+        title = describe_catalog_path(path)
+        markup = types.InlineKeyboardMarkup()
+        markup.add(
+            types.InlineKeyboardButton(
+                "🔔 Подписаться", callback_data=callback_data("isub", doc_id)
+            )
+        )
+        results.append(
+            types.InlineQueryResultArticle(
+                id=doc_id,
+                title=title,
+                description=f"{year_from}-{year_to}, пробег 0-200000 км",
+                input_message_content=types.InputTextMessageContent(
+                    f"🔎 {title}\nГоды: {year_from}-{year_to}\n"
+                    "Нажмите кнопку ниже, чтобы подписаться на новые поступления."
+                ),
+                reply_markup=markup,
+            )
+        )
+
+    bot.answer_inline_query(inline_query.id, results, cache_time=30, is_personal=True)
+
+
+@router.route("isub", args=1)
+def handle_inline_subscribe(call, doc_id):
+    user_id = call.from_user.id
+    if not is_authorized(user_id):
+        answer_callback(call, "❌ У вас нет доступа к боту.")
+        return
+
+    path = catalog_index.document(doc_id)
+    if not path:
+        answer_callback(call, "⚠️ Результат устарел, повторите поиск.")
+        return
+
+    manufacturer, model_group, model, trim = path
+    generation = catalog_index.node(path[:3]) or {}
+    year_from, year_to = generation_years(generation.get("metadata", {}))
+
+    # Сообщение из inline-режима может быть в чужом чате — уведомления шлём в личку
+    saved = add_search_request(
+        user_id,
+        user_id,
         {
             "manufacturer": manufacturer,
             "model_group": model_group,
@@ -915,31 +1572,20 @@ def handle_mileage_to(call):
             "trim": trim,
             "year_from": year_from,
             "year_to": year_to,
-            "mileage_from": mileage_from,
-            "mileage_to": mileage_to,
-        }
+            "mileage_from": 0,
+            "mileage_to": 200000,
+        },
+    )
+    if not saved:
+        answer_callback(call, REQUEST_LIMIT_TEXT)
+        return
+    answer_callback(call, "✅ Подписка оформлена.")
+    bot.send_message(
+        user_id,
+        f"✅ Вы подписались на {describe_catalog_path(path)}\n"
+        f"Годы: {year_from}-{year_to}, пробег: 0-200000 км",
+        reply_markup=keyboard_cache.get("next_action", (), build_next_action_markup),
     )
-
-    save_requests(user_requests)
-
-    import threading
-
-    threading.Thread(
-        target=check_for_new_cars,
-        args=(
-            call.message.chat.id,
-            manufacturer.strip(),
-            model_group.strip(),
-            model.strip(),
-            trim.strip(),
-            year_from,
-            year_to,
-            mileage_from,
-            mileage_to,
-            "",  # Пустая строка вместо цвета
-        ),
-        daemon=True,
-    ).start()
 
 
 @bot.message_handler(state=CarForm.brand)
@@ -955,158 +1601,303 @@ def handle_model(message):
     bot.set_state(message.from_user.id, CarForm.generation, message.chat.id)
 
 
-checked_ids = set()
+# Валидаторы последнего ответа каталога по хэшу запроса и Id объявлений в
+# нём: на 304 эти объявления по-прежнему в выдаче
+catalog_validators = ResponseValidators()
+catalog_pages = TTLCache(86400, maxsize=10000)
+
+
+def fetch_listings(query, seen=()):
+    # Один запрос каталога группы подписок: (объявления, commit); объявления
+    # None — ответ не удалось разобрать. Неизменившийся ответ (304 или то же
+    # тело) не разбирается вовсе, в остальных разбираются только новые
+    # объявления до уже просмотренных. commit() запоминает валидаторы ответа
+    # и вызывается, когда объявления уже записаны в outbox и историю.
+    # Объявления ответа отмечаются в истории как присутствующие в выдаче
+    key = query_hash(query)
+    response = upstream_get(
+        to_url(query, PROXY_BASE_URL),
+        "catalog",
+        headers={"User-Agent": "Mozilla/5.0", **catalog_validators.headers(key)},
+    )
+    if response.status_code in (200, 304) and catalog_validators.unchanged(
+        key, response
+    ):
+        metrics.CATALOG_UNCHANGED.inc()
+        listing_history.mark_listed(catalog_pages.get(key))
+        return [], lambda: None
+    if response.status_code != 200:
+        logger.warning(
+            "API вернул статус %s: %s",
+            response.status_code,
+            response.text,
+            extra=fields(query=key),
+        )
+        return None, lambda: None
+    try:
+        listings, present = parse_search_results(response.content.decode("utf-8"), seen)
+    except ValueError as json_err:
+        logger.warning(
+            "Ошибка парсинга JSON: %s, ответ: %s",
+            json_err,
+            response.text,
+            extra=fields(query=key),
+        )
+        return None, lambda: None
+    metrics.LISTINGS_PARSED.inc(len(present))
 
+    def commit():
+        catalog_validators.remember(key, response)
+        catalog_pages.set(key, present)
+        listing_history.mark_listed(present)
 
-def build_encar_url(
-    manufacturer,
-    model_group,
-    model,
-    trim,
-    year_from,
-    year_to,
-    mileage_from,
-    mileage_to,
-    color,  # параметр оставляем для совместимости с существующим кодом
-):
-    if not all(
-        [manufacturer.strip(), model_group.strip(), model.strip(), trim.strip()]
-    ):
-        print("❌ Не переданы необходимые параметры для построения URL")
-        return ""
-
-    # Convert years to format YYYYMM
-    year_from_formatted = f"{year_from}00"
-    year_to_formatted = f"{year_to}99"
-
-    # Подготавливаем имя модели - добавляем '_' после кода модели
-    if "(" in model and ")" in model:
-        base_name, code_part = model.rsplit("(", 1)
-        code = code_part.rstrip(")")
-        # Убираем пробелы перед скобкой для соответствия формату API
-        base_name = base_name.rstrip()
-        model_formatted = f"{base_name}({code}_)"
+    return listings, commit
+
+
+# Заголовок уведомления по виду изменения из истории объявлений
+CHANGE_HEADERS = {
+    "new": "✅ Новое поступление по вашему запросу!",
+    "price_drop": "📉 Снижена цена автомобиля по вашему запросу!",
+    "relisted": "🔁 Автомобиль по вашему запросу снова в продаже!",
+}
+
+
+# Подробности машины нужны каждому получателю уведомления — кэшируем, чтобы
+# не запрашивать Encar на каждый чат
+vehicle_cache = TTLCache(600, maxsize=4096)
+# Время в API Encar — корейское, без часового пояса
+ENCAR_TZ = timezone(timedelta(hours=9))
+
+
+def encar_time(value):
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=ENCAR_TZ)
+    return moment.timestamp()
+
+
+def vehicle_info(car_id):
+    # (объём двигателя, время размещения на Encar или None) или None, если
+    # подробности не получить
+    info = vehicle_cache.get(car_id)
+    if info is None:
+        details_url = f"{ENCAR_API_URL}/v1/readside/vehicle/{car_id}"
+        details_response = upstream_get(
+            details_url, "vehicle", headers={"User-Agent": "Mozilla/5.0"}
+        )
+        if details_response.status_code != 200:
+            return None
+        details = details_response.json()
+        info = (
+            details.get("spec", {}).get("displacement", "Не указано"),
+            encar_time(details.get("manage", {}).get("firstAdvertisedDateTime")),
+        )
+        vehicle_cache.set(car_id, info)
+    return info
+
+
+def advertised_since(car):
+    info = vehicle_info(car["Id"])
+    return None if info is None else info[1]
+
+
+def notification_text(car, change):
+    info = vehicle_info(car["Id"])
+    if info is not None:
+        displacement = info[0]
+        extra_text = f"\nОбъём двигателя: {displacement}cc\n\n👉 <a href='https://fem.encar.com/cars/detail/{car['Id']}'>Ссылка на автомобиль</a>"
     else:
-        model_formatted = model
-
-    # Используем urllib.parse.quote только для отдельных значений,
-    # оставляя структурные элементы (скобки, точки) как есть
-    manufacturer_encoded = urllib.parse.quote(manufacturer)
-    model_group_encoded = urllib.parse.quote(model_group)
-    model_formatted_encoded = urllib.parse.quote(model_formatted)
-    trim_encoded = urllib.parse.quote(trim)
-    sell_type_encoded = urllib.parse.quote("일반")
-
-    # Формируем URL точно как в рабочем примере, без указания цвета
-    url = (
-        f"https://bazarishauto-proxy.onrender.com/api/catalog?count=true&q="
-        f"(And.Hidden.N._.SellType.{sell_type_encoded}._."
-        f"(C.CarType.A._."
-        f"(C.Manufacturer.{manufacturer_encoded}._."
-        f"(C.ModelGroup.{model_group_encoded}._."
-        f"(C.Model.{model_formatted_encoded}._.BadgeGroup.{trim_encoded}.))))_."
-        f"Year.range({year_from_formatted}..{year_to_formatted})._."
-        f"Mileage.range({mileage_from}..{mileage_to}).)"
-        f"&sr=%7CModifiedDate%7C0%7C1"
-    )
-
-    print(f"📡 Сформирован URL: {url}")
-    return url
-
-
-def check_for_new_cars(
-    chat_id,
-    manufacturer,
-    model_group,
-    model,
-    trim,
-    year_from,
-    year_to,
-    mileage_from,
-    mileage_to,
-    color,
-):
-    url = build_encar_url(
-        manufacturer,
-        model_group,
-        model,
-        trim,
-        year_from,
-        year_to,
-        mileage_from,
-        mileage_to,
-        color,
+        extra_text = "\nℹ️ Не удалось получить подробности о машине."
+
+    name = (
+        f'{car.get("Manufacturer", "")} {car.get("Model", "")} {car.get("Badge", "")}'
     )
+    price = car.get("Price", 0)
+    mileage = car.get("Mileage", 0)
+    year = car.get("FormYear", "")
 
+    def format_number(n):
+        return f"{int(n):,}".replace(",", " ")
+
+    formatted_mileage = format_number(mileage)
+    formatted_price = format_number(price * 10000)
+
+    if change.kind == "price_drop":
+        formatted_price = (
+            f"<s>₩{format_number(change.previous_price * 10000)}</s> ₩{formatted_price}"
+        )
+    else:
+        formatted_price = f"₩{formatted_price}"
+
+    return (
+        f"{CHANGE_HEADERS[change.kind]}\n\n<b>{name}</b> {year} г.\nПробег: {formatted_mileage} км\nЦена: {formatted_price}"
+        + extra_text
+    )
+
+
+def deliver_notification(chat_id, user_id, car, change):
+    # Отправитель outbox: True — доставлено, False — чат недоступен и запись
+    # снимается; исключение — временная ошибка, outbox повторит отправку.
+    # Доступ проверяется у владельца подписки: чат может быть группой
+    if poll_scheduler.is_suspended(chat_id) or poll_scheduler.is_suspended(user_id):
+        return False
+    if not is_authorized(user_id):
+        metrics.NOTIFICATIONS_FAILED.labels("access").inc()
+        poll_scheduler.suspend(user_id, "доступ отозван")
+        return False
+
+    markup = keyboard_cache.get("next_action", (), build_next_action_markup)
+    try:
+        bot.send_message(
+            chat_id,
+            notification_text(car, change),
+            parse_mode="HTML",
+            reply_markup=markup,
+        )
+    except apihelper.ApiTelegramException as e:
+        if not is_permanent_delivery_error(e):
+            metrics.NOTIFICATIONS_FAILED.labels("error").inc()
+            raise
+        metrics.NOTIFICATIONS_FAILED.labels("blocked").inc()
+        poll_scheduler.suspend(chat_id, e.description)
+        return False
+    metrics.NOTIFICATIONS_SENT.inc()
+    return True
+
+
+def is_permanent_delivery_error(error):
+    # 403 — бот заблокирован, удалён из чата или аккаунт удалён; 400 «chat not
+    # found» — чата больше нет. Повторная отправка таким чатам бессмысленна
+    description = (error.description or "").lower()
+    return error.error_code == 403 or (
+        error.error_code == 400 and "chat not found" in description
+    )
+
+
+# Подписки на одну модель опрашиваются одним запросом с Or по комплектациям
+listing_history = ListingHistory(
+    HISTORY_FILE, RELIST_AFTER_DAYS * 86400, advertised_since
+)
+seen_versions = SeenVersions(listing_history, SEEN_FILTER_FILE)
+# Тарифы опроса: менеджеры получают больший вес в общем бюджете и более
+# частый опрос
+DEFAULT_TIER = Tier(1.0, POLL_INTERVAL)
+PRIORITY_TIER = Tier(PRIORITY_WEIGHT, PRIORITY_POLL_INTERVAL)
+
+
+def poll_tier(chat_id):
+    return PRIORITY_TIER if chat_id in PRIORITY_USER_IDS else DEFAULT_TIER
+
+
+notification_outbox = Outbox(
+    OUTBOX_FILE,
+    deliver_notification,
+    workers=OUTBOX_WORKERS,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+)
+poll_scheduler = PollScheduler(
+    fetch_listings,
+    notification_outbox,
+    listing_history,
+    seen_versions,
+    poll_tier,
+    POLL_BUDGET_PER_MINUTE,
+    POLL_WORKERS,
+)
+
+
+def save_seen_filter():
+    # Фильтр просмотренных сохраняется периодически и при выходе, чтобы после
+    # перезапуска не собирать его заново из истории
     while True:
-        try:
-            response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
+        time.sleep(SEEN_FILTER_SAVE_INTERVAL)
+        seen_versions.save()
 
-            if response.status_code != 200:
-                print(f"❌ API вернул статус {response.status_code}: {response.text}")
-                time.sleep(300)
-                continue
 
-            try:
-                data = response.json()
-            except Exception as json_err:
-                print(f"❌ Ошибка парсинга JSON: {json_err}")
-                print(f"Ответ: {response.text}")
-                time.sleep(300)
-                continue
+# Статистика рынка считается по истории, без запросов к прокси
+market_stats = MarketStats(listing_history, window=STATS_WINDOW_DAYS * 86400)
 
-            cars = data.get("SearchResults", [])
-            new_cars = [car for car in cars if car["Id"] not in checked_ids]
 
-            for car in new_cars:
-                checked_ids.add(car["Id"])
-                details_url = f"https://api.encar.com/v1/readside/vehicle/{car['Id']}"
-                details_response = requests.get(
-                    details_url, headers={"User-Agent": "Mozilla/5.0"}
-                )
+def format_stats(title, summary):
+    if not summary.count:
+        return f"📊 {title}\n\nВ истории объявлений пока нет подходящих машин."
 
-                if details_response.status_code == 200:
-                    details_data = details_response.json()
-                    specs = details_data.get("spec", {})
-                    displacement = specs.get("displacement", "Не указано")
-                    extra_text = f"\nОбъём двигателя: {displacement}cc\n\n👉 <a href='https://fem.encar.com/cars/detail/{car['Id']}'>Ссылка на автомобиль</a>"
-                else:
-                    extra_text = "\nℹ️ Не удалось получить подробности о машине."
+    def won(price):
+        return "₩" + f"{int(price * 10000):,}".replace(",", " ")
 
-                name = f'{car.get("Manufacturer", "")} {car.get("Model", "")} {car.get("Badge", "")}'
-                price = car.get("Price", 0)
-                mileage = car.get("Mileage", 0)
-                year = car.get("FormYear", "")
+    def km(mileage):
+        return f"{int(mileage):,}".replace(",", " ") + " км"
 
-                def format_number(n):
-                    return f"{int(n):,}".replace(",", " ")
+    lines = [f"📊 {title}", "", f"Объявлений: {summary.count}", "", "Цена:"]
+    lines += [f"  {p}%: {won(v)}" for p, v in summary.price.items()]
+    lines += ["", "Пробег:"]
+    lines += [f"  {p}%: {km(v)}" for p, v in summary.mileage.items()]
+    if summary.median_price_by_year:
+        lines += ["", "Медианная цена по году выпуска:"]
+        lines += [
+            f"  {year}: {won(v)}" for year, v in summary.median_price_by_year.items()
+        ]
+    return "\n".join(lines)
 
-                formatted_mileage = format_number(mileage)
-                formatted_price = format_number(price * 10000)
 
-                text = (
-                    f"✅ Новое поступление по вашему запросу!\n\n<b>{name}</b> {year} г.\nПробег: {formatted_mileage} км\nЦена: ₩{formatted_price}"
-                    + extra_text
-                )
-                markup = types.InlineKeyboardMarkup()
-                markup.add(
-                    types.InlineKeyboardButton(
-                        "➕ Добавить новый автомобиль в поиск",
-                        callback_data="search_car",
-                    )
-                )
-                markup.add(
-                    types.InlineKeyboardButton(
-                        "🏠 Вернуться в главное меню",
-                        callback_data="start",
-                    )
-                )
-                bot.send_message(chat_id, text, parse_mode="HTML", reply_markup=markup)
+@bot.message_handler(commands=["stats"])
+def handle_stats_command(message):
+    # /stats — выбор сохранённого запроса, /stats <марка, модель…> — поиск
+    if not is_authorized(message.from_user.id):
+        bot.reply_to(message, "❌ У вас нет доступа к этому боту.")
+        return
 
-            time.sleep(300)
-        except Exception as e:
-            print(f"🔧 Общая ошибка при проверке новых авто: {e}")
-            time.sleep(300)
+    text = (message.text or "").partition(" ")[2].strip()
+    if text:
+        bot.send_message(message.chat.id, format_stats(text, market_stats.search(text)))
+        return
+
+    searches = user_requests.get(str(message.from_user.id)) or []
+    if not searches:
+        bot.reply_to(
+            message,
+            "Укажите марку, модель или комплектацию: /stats 그랜저\n"
+            "Или сохраните запрос через 'Поиск авто'.",
+        )
+        return
+
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    for idx, req in enumerate(searches):
+        markup.add(
+            types.InlineKeyboardButton(
+                f"📊 {req['manufacturer']} {req['model']} {req['trim']}",
+                callback_data=callback_data("stats", idx),
+            )
+        )
+    bot.send_message(
+        message.chat.id, "Выберите запрос для статистики рынка:", reply_markup=markup
+    )
+
+
+@router.route("stats", args=1)
+def handle_stats_callback(call, index):
+    if not is_authorized(call.from_user.id):
+        bot.send_message(call.message.chat.id, "❌ У вас нет доступа к боту.")
+        return
+
+    searches = user_requests.get(str(call.from_user.id)) or []
+    index = int(index)
+    if not 0 <= index < len(searches):
+        answer_callback(call, "Запрос не найден.")
+        return
+
+    req = searches[index]
+    title = (
+        f"{req['manufacturer']} {req['model']} {req['trim']}, "
+        f"{req['year_from']}-{req['year_to']}, "
+        f"{req['mileage_from']}-{req['mileage_to']} км"
+    )
+    bot.send_message(
+        call.message.chat.id, format_stats(title, market_stats.for_request(req))
+    )
 
 
 # Добавленный код для команд userlist и remove_user
@@ -1146,6 +1937,7 @@ def handle_remove_user(message):
         if user_id_to_remove in ACCESS:
             ACCESS.remove(user_id_to_remove)
             save_access()
+            poll_scheduler.suspend(user_id_to_remove, "доступ отозван")
             bot.reply_to(
                 message, f"✅ Пользователь {user_id_to_remove} удалён из доступа."
             )
@@ -1157,16 +1949,56 @@ def handle_remove_user(message):
 
 # Запуск бота
 if __name__ == "__main__":
-    from datetime import datetime
-
-    print("=" * 50)
-    print(
-        f"🚀 [KGA Korea Bot] Запуск бота — {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    )
-    print("📦 Загрузка сохранённых запросов пользователей...")
-    load_requests()
-    print("✅ Запросы успешно загружены.")
-    print("🤖 Бот запущен и ожидает команды...")
-    print("=" * 50)
-    ACCESS = load_access()
-    bot.infinity_polling()
+    logger.info(
+        "🚀 [KGA Korea Bot] Запуск бота — %s",
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    with startup_timer.phase("load requests"):
+        load_requests()
+    logger.info("Загружены запросы %d пользователей", len(user_requests))
+    with startup_timer.phase("schedule requests"):
+        scheduled = schedule_saved_requests()
+    logger.info("В опросе %d сохранённых запросов", scheduled)
+    with startup_timer.phase("load access"):
+        ACCESS = load_access()
+    logger.info("🤖 Бот запущен и ожидает команды...")
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT, METRICS_HOST)
+        logger.info(
+            "Метрики доступны на http://%s:%d/metrics", METRICS_HOST, METRICS_PORT
+        )
+    if CAPTURE_FILE:
+        capture.start(CAPTURE_FILE, poll_interval=POLL_INTERVAL)
+        capture.record_subscriptions(user_requests)
+    startup_timer.report()
+
+    # Тяжёлую подготовку делаем в фоне, чтобы начать опрос Telegram как можно раньше
+    background_pool.put(translator.warm)
+    if CATALOG_CRAWL:
+        threading.Thread(target=crawl_catalog, daemon=True).start()
+    threading.Thread(target=save_seen_filter, daemon=True).start()
+    # Неотправленные до перезапуска уведомления уходят сразу
+    notification_outbox.start()
+    atexit.register(seen_versions.save)
+
+    if WEBHOOK_URL:
+        # Обработчики выполняются прямо в потоках пула вебхука, а не в пуле telebot
+        bot.threaded = False
+        secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        server = WebhookServer(
+            bot,
+            urllib.parse.urlsplit(WEBHOOK_URL).path or "/",
+            secret,
+            workers=WEBHOOK_WORKERS,
+            queue_size=WEBHOOK_QUEUE_SIZE,
+        )
+        server.start(WEBHOOK_HOST, WEBHOOK_PORT)
+        bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=secret,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        threading.Event().wait()
+    else:
+        bot.remove_webhook()
+        bot.infinity_polling()
@@ -0,0 +1,316 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        # Метрика без меток работает как единственный потомок
+        return self.labels()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value:g}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        # Значение вычисляется в момент снятия метрик
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            self.set(self._function())
+        return super().render()
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(labelnames, values, [("le", f"{bound:g}")])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, values, [("le", "+Inf")])
+        lines.append(f"{name}_bucket{labels} {count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {total:g}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(*args, **kwargs)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Отдаёт /metrics в текстовом формате Prometheus из фонового потока."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+# Метрики бота
+UPSTREAM_REQUESTS = Counter(
+    "kga_upstream_requests_total",
+    "Запросы к внешним API по типу и HTTP-статусу",
+    ["kind", "status"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "kga_upstream_request_seconds", "Длительность запросов к внешним API", ["kind"]
+)
+TELEGRAM_REQUESTS = Counter(
+    "kga_telegram_requests_total",
+    "Вызовы Telegram Bot API по методу и HTTP-статусу",
+    ["method", "status"],
+)
+TELEGRAM_LATENCY = Histogram(
+    "kga_telegram_request_seconds", "Длительность вызовов Telegram Bot API", ["method"]
+)
+TELEGRAM_RATE_LIMITED = Counter(
+    "kga_telegram_rate_limited_total", "Ответы 429 от Telegram Bot API", ["method"]
+)
+CALLBACK_LATENCY = Histogram(
+    "kga_callback_seconds", "Время обработки callback-кнопок", ["action"]
+)
+CALLBACK_ERRORS = Counter(
+    "kga_callback_errors_total", "Исключения в обработчиках callback-кнопок", ["action"]
+)
+NOTIFICATIONS_SENT = Counter(
+    "kga_notifications_sent_total", "Отправленные уведомления о новых авто"
+)
+NOTIFICATIONS_FAILED = Counter(
+    "kga_notifications_failed_total",
+    "Недоставленные уведомления: blocked — чат недоступен навсегда, access — "
+    "доступ отозван, error — временная ошибка",
+    ["reason"],
+)
+SUSPENDED_CHATS = Gauge("kga_suspended_chats", "Чаты с приостановленными подписками")
+ACTIVE_SUBSCRIPTIONS = Gauge(
+    "kga_active_subscriptions", "Сохранённые запросы поиска всех пользователей"
+)
+ACTIVE_POLLERS = Gauge("kga_active_pollers", "Группы подписок в очереди опроса")
+WEBHOOK_UPDATES = Counter(
+    "kga_webhook_updates_total",
+    "Запросы к вебхуку: принятые и отклонённые по причине",
+    ["result"],
+)
+WEBHOOK_QUEUE = Gauge("kga_webhook_queue", "Обновления в очереди вебхука")
+WORKER_QUEUE = Gauge("kga_worker_queue", "Задачи в очереди пула потоков", ["pool"])
+WORKER_BUSY = Gauge("kga_worker_busy", "Занятые потоки пула", ["pool"])
+WORKER_WAIT = Histogram(
+    "kga_worker_wait_seconds", "Время ожидания задачи в очереди пула", ["pool"]
+)
+WORKER_REJECTED = Counter(
+    "kga_worker_rejected_total", "Задачи, отклонённые из-за полной очереди", ["pool"]
+)
+NAV_FETCHES = Counter(
+    "kga_nav_fetches_total", "Загрузки уровней каталога с прокси (промахи кэша)"
+)
+NAV_COALESCED = Counter(
+    "kga_nav_coalesced_total",
+    "Запросы уровней каталога, дождавшиеся уже идущей загрузки",
+)
+CATALOG_UNCHANGED = Counter(
+    "kga_catalog_unchanged_total",
+    "Опросы каталога без изменений (304 или тот же ответ) — без разбора JSON",
+)
+LISTINGS_PARSED = Counter(
+    "kga_catalog_listings_parsed_total",
+    "Объявления, разобранные из ответов каталога до остановки на просмотренных",
+)
+SEEN_FILTER_CHECKS = Counter(
+    "kga_seen_filter_checks_total",
+    "Проверки просмотренных объявлений: miss — ответ фильтра Блума, hit и "
+    "false_positive — после сверки с историей",
+    ["result"],
+)
+SEEN_FILTER_BYTES = Gauge(
+    "kga_seen_filter_bytes", "Размер фильтра Блума просмотренных объявлений"
+)
+POLL_BUDGET_WAIT = Histogram(
+    "kga_poll_budget_wait_seconds",
+    "Ожидание токена общего бюджета запросов к прокси перед опросом каталога",
+    buckets=(0, 0.1, 0.5, 1, 5, 15, 30, 60, 120, 300),
+)
+OUTBOX_PENDING = Gauge("kga_outbox_pending", "Уведомления в outbox, ожидающие отправки")
+OUTBOX_ENQUEUED = Counter(
+    "kga_outbox_enqueued_total", "Уведомления, записанные в outbox (без повторов)"
+)
+OUTBOX_FINISHED = Counter(
+    "kga_outbox_finished_total",
+    "Записи outbox по итогу: delivered, dropped (чат недоступен), failed",
+    ["status"],
+)
+OUTBOX_RETRIES = Counter(
+    "kga_outbox_retries_total", "Отложенные после временной ошибки отправки"
+)
@@ -0,0 +1,266 @@
+"""Очередь уведомлений в SQLite (transactional outbox).
+
+Опрос сначала записывает уведомления в outbox и только потом отмечает
+объявления в истории, поэтому падение между этими шагами не теряет
+уведомление, а повтор опроса не создаёт второе: запись уникальна по
+(чат, версия объявления, вид изменения). Отправители забирают ожидающие
+записи, при временной ошибке откладывают их с растущей паузой и отмечают
+доставленные.
+
+Telegram не принимает ключ идемпотентности, поэтому «ровно один раз»
+держится на том, что запись отмечается доставленной сразу после ответа
+sendMessage: повтор возможен, только если процесс упадёт между ними или
+отметку не удастся записать (тогда запись вернётся через claim_timeout).
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+from history import Change
+from listings import LISTING_FIELDS, Listing, listing_version
+from log import fields, get_logger
+
+logger = get_logger("outbox")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    version TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    UNIQUE (chat_id, version, kind)
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, next_attempt);
+CREATE TABLE IF NOT EXISTS suspended (
+    chat_id INTEGER PRIMARY KEY,
+    reason TEXT,
+    since REAL NOT NULL
+);
+"""
+
+# pending — ждёт отправки, sending — взята отправителем, delivered —
+# доставлена, dropped — доставлять некому (чат недоступен), failed —
+# исчерпаны попытки
+
+
+class Outbox:
+    """deliver(chat_id, user_id, car, change) отправляет уведомление в чат
+    подписки пользователя user_id: True —
+    доставлено, False — доставлять некому; исключение — временная ошибка,
+    запись будет повторена."""
+
+    def __init__(
+        self,
+        path,
+        deliver,
+        workers=4,
+        max_attempts=8,
+        retry_delay=5.0,
+        keep_for=7 * 86400,
+        claim_timeout=300.0,
+    ):
+        self.deliver = deliver
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.keep_for = keep_for
+        # Взятая отправителем запись, которую не удалось отметить (ошибка
+        # SQLite), через claim_timeout снова считается ожидающей
+        self.claim_timeout = claim_timeout
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._tasks = queue.Queue(workers * 2)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        with self._db:
+            # Записи, которые отправлялись в момент падения, отправляем снова
+            self._db.execute(
+                "UPDATE outbox SET status = 'pending' WHERE status = 'sending'"
+            )
+        metrics.OUTBOX_PENDING.set_function(self.pending)
+
+    def enqueue(self, items):
+        """items — тройки (объявление, получатели, Change), получатели — пары
+        (чат, владелец подписки). Повторная запись того же
+        уведомления игнорируется. Возвращает число новых записей."""
+        now = time.time()
+        rows = [
+            (
+                chat_id,
+                user_id,
+                listing_version(car),
+                change.kind,
+                json.dumps(
+                    {
+                        "car": {field: car.get(field) for field in LISTING_FIELDS},
+                        "previous_price": change.previous_price,
+                    },
+                    ensure_ascii=False,
+                ),
+                now,
+                now,
+            )
+            for car, recipients, change in items
+            for chat_id, user_id in recipients
+        ]
+        if not rows:
+            return 0
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO outbox (chat_id, user_id, version, kind,"
+                " payload, next_attempt, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            added = self._db.total_changes - before
+        metrics.OUTBOX_ENQUEUED.inc(added)
+        self._wakeup.set()
+        return added
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+
+    def suspended(self):
+        """Чаты и пользователи, подписки которых приостановлены
+        (PollScheduler.suspend)."""
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT chat_id FROM suspended")}
+
+    def suspend(self, chat_id, reason):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO suspended VALUES (?, ?, ?)",
+                (chat_id, reason, time.time()),
+            )
+
+    def resume(self, chat_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM suspended WHERE chat_id = ?", (chat_id,))
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"outbox-{i}", daemon=True).start()
+        threading.Thread(target=self._dispatch, name="outbox", daemon=True).start()
+
+    def _claim(self, limit):
+        now = time.time()
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT id, chat_id, user_id, kind, payload, attempts FROM outbox"
+                " WHERE status IN ('pending', 'sending') AND next_attempt <= ?"
+                " ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE outbox SET status = 'sending', next_attempt = ? WHERE id = ?",
+                [(now + self.claim_timeout, row[0]) for row in rows],
+            )
+            next_attempt = self._db.execute(
+                "SELECT MIN(next_attempt) FROM outbox"
+                " WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+        return rows, next_attempt
+
+    def _dispatch(self):
+        pruned = 0.0
+        while True:
+            try:
+                rows, next_attempt = self._claim(self.workers * 4)
+            except Exception as e:
+                logger.exception("Не удалось выбрать уведомления: %s", e)
+                rows, next_attempt = [], None
+            for row in rows:
+                self._tasks.put(row)
+            if time.monotonic() - pruned >= 3600:
+                pruned = time.monotonic()
+                try:
+                    self._prune()
+                except Exception as e:
+                    logger.exception("Не удалось очистить outbox: %s", e)
+            if rows:
+                continue
+            self._wakeup.wait(
+                1.0 if next_attempt is None else max(0.0, next_attempt - time.time())
+            )
+            self._wakeup.clear()
+
+    def _work(self):
+        while True:
+            entry_id, chat_id, user_id, kind, payload, attempts = self._tasks.get()
+            try:
+                self._send(entry_id, chat_id, user_id, kind, payload, attempts)
+            except Exception as e:
+                # Запись не отмечена и вернётся в очередь через claim_timeout
+                logger.exception(
+                    "Ошибка очереди уведомлений: %s", e, extra=fields(chat_id=chat_id)
+                )
+
+    def _send(self, entry_id, chat_id, user_id, kind, payload, attempts):
+        data = json.loads(payload)
+        car = Listing(data["car"])
+        try:
+            delivered = self.deliver(
+                chat_id, user_id, car, Change(kind, data["previous_price"])
+            )
+        except Exception as e:
+            self._retry(entry_id, attempts + 1, e, chat_id)
+            return
+        self._finish(entry_id, "delivered" if delivered else "dropped")
+
+    def _finish(self, entry_id, status):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, finished = ? WHERE id = ?",
+                (status, time.time(), entry_id),
+            )
+        metrics.OUTBOX_FINISHED.labels(status).inc()
+
+    def _retry(self, entry_id, attempts, error, chat_id):
+        if attempts >= self.max_attempts:
+            logger.error(
+                "Уведомление не доставлено за %d попыток: %s",
+                attempts,
+                error,
+                extra=fields(chat_id=chat_id),
+            )
+            self._finish(entry_id, "failed")
+            return
+        delay = self.retry_delay * 2 ** (attempts - 1)
+        logger.warning(
+            "Уведомление отложено на %.0f с: %s",
+            delay,
+            error,
+            extra=fields(chat_id=chat_id),
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET status = 'pending', attempts = ?,"
+                " next_attempt = ? WHERE id = ?",
+                (attempts, time.time() + delay, entry_id),
+            )
+        metrics.OUTBOX_RETRIES.inc()
+        self._wakeup.set()
+
+    def _prune(self):
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM outbox WHERE status NOT IN ('pending', 'sending')"
+                " AND finished < ?",
+                (time.time() - self.keep_for,),
+            )
@@ -0,0 +1,190 @@
+"""Запросы к каталогу в виде небольшого дерева вместо склеенных вручную строк.
+
+Синтаксис прокси: (And.Hidden.N._.(C.Manufacturer.현대._.ModelGroup.그랜저.)_.
+Year.range(201800..202599).) — условия группы разделяются «_.», каждое
+условие заканчивается точкой, C — вложенный уровень иерархии каталога.
+"""
+
+import functools
+import hashlib
+import urllib.parse
+from typing import NamedTuple, Optional, Tuple, Union
+
+
+class Eq(NamedTuple):
+    field: str
+    value: str
+
+
+class Range(NamedTuple):
+    field: str
+    low: Union[int, str]
+    high: Union[int, str]
+
+
+class Group(NamedTuple):
+    op: str  # And | Or | C
+    terms: Tuple["Term", ...]
+
+
+Term = Union[Eq, Range, Group]
+
+
+class Sort(NamedTuple):
+    field: str
+    offset: int = 0
+    count: int = 1
+
+
+class Query(NamedTuple):
+    endpoint: str  # nav | catalog
+    where: Group
+    sort: Optional[Sort] = None
+
+
+def And(*terms):
+    return Group("And", tuple(terms))
+
+
+def Or(*terms):
+    # Порядок альтернатив не важен: сортируем и убираем повторы
+    return Group("Or", tuple(sorted(set(terms))))
+
+
+def hierarchy(*levels):
+    """Вложенные уровни каталога: hierarchy(("CarType", "A"), ("Manufacturer", x))
+    -> (C.CarType.A._.Manufacturer.x.); один уровень — просто условие."""
+    terms = [
+        level if isinstance(level, Group) else Eq(*level) for level in levels if level
+    ]
+    group = terms[-1]
+    for term in reversed(terms[:-1]):
+        group = Group("C", (term, group))
+    return group
+
+
+def model_code(model):
+    # «그랜저 (GN7)» -> «그랜저(GN7_)»: так модель записывается в запросе каталога
+    if "(" in model and ")" in model:
+        base_name, code_part = model.rsplit("(", 1)
+        return f"{base_name.rstrip()}({code_part.rstrip(')')}_)"
+    return model
+
+
+def _normalize(term):
+    if isinstance(term, Eq):
+        return Eq(term.field, str(term.value).strip())
+    if isinstance(term, Range):
+        return Range(term.field, str(term.low).strip(), str(term.high).strip())
+    terms = tuple(_normalize(t) for t in term.terms)
+    if term.op == "Or":
+        terms = tuple(sorted(set(terms)))
+    return Group(term.op, terms)
+
+
+def _compile(term, quote):
+    if isinstance(term, Eq):
+        return f"{term.field}.{quote(term.value)}."
+    if isinstance(term, Range):
+        return f"{term.field}.range({term.low}..{term.high})."
+    return f"({term.op}." + "_.".join(_compile(t, quote) for t in term.terms) + ")"
+
+
+def _quote(value):
+    return urllib.parse.quote(value, safe="")
+
+
+def normalize(query):
+    return query._replace(where=_normalize(query.where))
+
+
+@functools.lru_cache(maxsize=4096)
+def canonical(query):
+    """Нормализованная запись запроса без URL-кодирования — основа для хэша."""
+    query = normalize(query)
+    text = f"{query.endpoint}:{_compile(query.where, str)}"
+    if query.sort is not None:
+        text += f"|{query.sort.field}|{query.sort.offset}|{query.sort.count}"
+    return text
+
+
+@functools.lru_cache(maxsize=4096)
+def query_hash(query):
+    """Стабильный короткий ключ запроса: кэш результатов, опрос, логи."""
+    return hashlib.sha1(canonical(query).encode("utf-8")).hexdigest()[:16]
+
+
+@functools.lru_cache(maxsize=4096)
+def to_url(query, base_url):
+    query = normalize(query)
+    url = (
+        f"{base_url}/api/{query.endpoint}?count=true&q={_compile(query.where, _quote)}"
+    )
+    if query.endpoint == "nav":
+        url += "&inav=%7CMetadata%7CSort"
+    if query.sort is not None:
+        sort = f"|{query.sort.field}|{query.sort.offset}|{query.sort.count}"
+        url += f"&sr={_quote(sort)}"
+    return url
+
+
+# Общие условия всех запросов бота
+NOT_HIDDEN = Eq("Hidden", "N")
+SELL_TYPE = Eq("SellType", "일반")
+CAR_TYPE = ("CarType", "A")
+# Страница выдачи каталога: по CATALOG_PAGE_PER_TRIM свежих объявлений на
+# каждую комплектацию запроса, чтобы новые объявления соседних комплектаций
+# одного Or-запроса не вытесняли друг друга за интервал опроса
+CATALOG_PAGE_PER_TRIM = 10
+CATALOG_PAGE_MAX = 50
+
+
+def newest_first(trims):
+    return Sort("ModifiedDate", 0, min(CATALOG_PAGE_MAX, CATALOG_PAGE_PER_TRIM * trims))
+
+
+def nav_query(manufacturer=None, model_group=None, model=None):
+    """Запрос навигации по уровню каталога, как в четырёх nav-функциях бота.
+    Запрос комплектаций (с моделью) прокси принимает без SellType."""
+    levels = [CAR_TYPE]
+    for field, value in (
+        ("Manufacturer", manufacturer),
+        ("ModelGroup", model_group),
+        ("Model", model),
+    ):
+        if value:
+            levels.append((field, value))
+    terms = [NOT_HIDDEN] if model else [NOT_HIDDEN, SELL_TYPE]
+    return Query("nav", And(*terms, hierarchy(*levels)))
+
+
+def catalog_query(
+    manufacturer,
+    model_group,
+    model,
+    trims,
+    year_from,
+    year_to,
+    mileage_from,
+    mileage_to,
+):
+    """Запрос новых объявлений, свежие сверху; trims — комплектация или
+    несколько комплектаций одной модели (Or по BadgeGroup). Размер страницы
+    растёт с числом комплектаций (newest_first)."""
+    if isinstance(trims, str):
+        trims = [trims]
+    badges = [Eq("BadgeGroup", trim) for trim in trims]
+    where = And(
+        NOT_HIDDEN,
+        SELL_TYPE,
+        hierarchy(
+            CAR_TYPE,
+            ("Manufacturer", manufacturer),
+            ("ModelGroup", model_group),
+            ("Model", model_code(model)),
+            badges[0] if len(set(badges)) == 1 else Or(*badges),
+        ),
+        Range("Year", f"{year_from}00", f"{year_to}99"),
+        Range("Mileage", mileage_from, mileage_to),
+    )
+    return Query("catalog", where, newest_first(len(set(trims))))
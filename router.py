@@ -0,0 +1,155 @@
+import functools
+import threading
+import time
+
+# Разделитель между действием и аргументами в callback_data: "brand:Hyundai:현대"
+SEPARATOR = ":"
+
+# Ответ на повторное нажатие кнопки, пока первое ещё обрабатывается
+DUPLICATE_CLICK_TEXT = "⏳ Уже загружаю, подождите…"
+
+
+def callback_data(action, *args):
+    return SEPARATOR.join([action, *(str(arg) for arg in args)])
+
+
+class RouteStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.duplicates = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed, failed=False):
+        with self._lock:
+            self.count += 1
+            self.total += elapsed
+            self.max = max(self.max, elapsed)
+            if failed:
+                self.errors += 1
+
+    def duplicate(self):
+        with self._lock:
+            self.duplicates += 1
+
+    def snapshot(self):
+        with self._lock:
+            avg = self.total / self.count if self.count else 0.0
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "duplicates": self.duplicates,
+                "avg_ms": round(avg * 1000, 2),
+                "max_ms": round(self.max * 1000, 2),
+            }
+
+
+class CallbackRouter:
+    """Разбирает префикс действия из callback_data один раз и вызывает
+    обработчик через словарь, вместо перебора цепочки lambda-предикатов."""
+
+    def __init__(self, observer=None, executor=None, ack=None):
+        self.routes = {}
+        self.stats = {}
+        # observer(action, elapsed, failed) — внешний сборщик метрик
+        self.observer = observer
+        # executor.put(func, *args) — пул для медленных маршрутов (background=True)
+        self.executor = executor
+        # ack(call, text=None) — ответ на нажатие; должен быть идемпотентным
+        self.ack = ack
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def route(self, action, args=0, background=False):
+        if SEPARATOR in action:
+            raise ValueError(f"Действие не может содержать '{SEPARATOR}': {action}")
+
+        def decorator(func):
+            if action in self.routes:
+                raise ValueError(f"Маршрут уже зарегистрирован: {action}")
+            self.routes[action] = (func, args, background)
+            self.stats[action] = RouteStats()
+            return func
+
+        return decorator
+
+    @staticmethod
+    def parse(data):
+        action, _, payload = (data or "").partition(SEPARATOR)
+        return action, payload
+
+    def dispatch(self, call):
+        action, payload = self.parse(call.data)
+        route = self.routes.get(action)
+        if route is None:
+            return False
+
+        func, nargs, background = route
+        # Последний аргумент забирает остаток строки, если в нём встретится разделитель
+        args = payload.split(SEPARATOR, nargs - 1) if nargs else []
+        if len(args) != nargs:
+            return False
+
+        if background and self.executor is not None:
+            self._dispatch_background(action, func, call, args)
+            return True
+
+        try:
+            self._invoke(action, func, call, args)
+        finally:
+            # Быстрые маршруты могут ответить сами (с текстом), иначе отвечаем здесь
+            self._ack(call)
+        return True
+
+    def _dispatch_background(self, action, func, call, args):
+        # Нажатие подтверждается сразу, чтобы кнопка не «крутилась» всё время
+        # загрузки, а повторные нажатия той же кнопки не ставят новых задач
+        key = (call.from_user.id, call.data)
+        with self._lock:
+            duplicate = key in self._in_flight
+            if not duplicate:
+                self._in_flight.add(key)
+        if duplicate:
+            self.stats[action].duplicate()
+            self._ack(call, DUPLICATE_CLICK_TEXT)
+            return
+
+        self._ack(call)
+        job = functools.partial(self._run_background, key, action, func, call, args)
+        # Имя задачи попадает в трассу и логи пула
+        job.__name__ = f"callback:{action}"
+        if not self.executor.put(job):
+            self._release(key)
+
+    def _run_background(self, key, action, func, call, args):
+        try:
+            self._invoke(action, func, call, args)
+        finally:
+            self._release(key)
+
+    def _release(self, key):
+        with self._lock:
+            self._in_flight.discard(key)
+
+    def _ack(self, call, text=None):
+        if self.ack is not None:
+            self.ack(call, text)
+
+    def _invoke(self, action, func, call, args):
+        started = time.perf_counter()
+        failed = False
+        try:
+            func(call, *args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats[action].observe(elapsed, failed)
+            if self.observer is not None:
+                self.observer(action, elapsed, failed)
+
+    def stats_snapshot(self):
+        return {action: stats.snapshot() for action, stats in self.stats.items()}
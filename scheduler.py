@@ -0,0 +1,425 @@
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple
+
+import metrics
+from listings import listing_version
+from log import fields, get_logger
+from query import catalog_query, model_code, query_hash
+from workers import BoundedWorkerPool
+
+logger = get_logger("scheduler")
+
+# Поля объявления, по которым комплектация узнаётся, если BadgeGroup в ответе нет
+_BADGE_TEXT_FIELDS = ("Badge", "BadgeDetail", "FuelType", "Transmission")
+
+
+class Subscription(NamedTuple):
+    chat_id: int  # куда слать уведомления: личка или группа
+    user_id: int  # кто сохранил запрос: по нему проверяется доступ и тариф
+    trim: str
+    year_from: int
+    year_to: int
+    mileage_from: int
+    mileage_to: int
+
+    def matches(self, car):
+        year = int(float(car.get("Year") or 0))
+        mileage = int(car.get("Mileage") or 0)
+        return int(self.year_from) * 100 <= year <= int(
+            self.year_to
+        ) * 100 + 99 and int(self.mileage_from) <= mileage <= int(self.mileage_to)
+
+
+def badge_of(car, trims):
+    """Комплектация объявления из trims или None, если её не определить."""
+    if car.get("BadgeGroup"):
+        return car["BadgeGroup"] if car["BadgeGroup"] in trims else None
+    if len(trims) == 1:
+        return next(iter(trims))
+    text = " ".join(str(car.get(field) or "") for field in _BADGE_TEXT_FIELDS)
+    tokens = set(text.lower().split())
+    found = [trim for trim in trims if set(trim.lower().split()) <= tokens]
+    return found[0] if len(found) == 1 else None
+
+
+class PollGroup:
+    """Подписки на одну модель: один запрос каталога с Or по комплектациям и
+    объединёнными диапазонами, результат делится по подписчикам локально."""
+
+    def __init__(self, manufacturer, model_group, model, seen):
+        self.manufacturer = manufacturer
+        self.model_group = model_group
+        self.model = model
+        # Подписка -> число одинаковых сохранённых запросов: удаление одного
+        # из них не должно снимать остальные
+        self.subscriptions = Counter()
+        # Общие для всех групп просмотренные версии (history.SeenVersions)
+        self.seen = seen
+        # Если комплектацию объявления не определить, группа опрашивается
+        # отдельными запросами по каждой комплектации
+        self.split = False
+        # Состояние очереди опроса: метка окончания последнего опроса в
+        # виртуальном времени, его стоимость в запросах, когда он закончился
+        self.finish = 0.0
+        self.cost = 1
+        self.polled = float("-inf")
+        self.running = False
+
+    def queries(self, subscriptions):
+        trims = sorted({s.trim for s in subscriptions})
+        batches = [[trim] for trim in trims] if self.split else [trims]
+        for batch in batches:
+            members = [s for s in subscriptions if s.trim in batch]
+            yield catalog_query(
+                self.manufacturer,
+                self.model_group,
+                self.model,
+                batch,
+                min(s.year_from for s in members),
+                max(s.year_to for s in members),
+                min(s.mileage_from for s in members),
+                max(s.mileage_to for s in members),
+            ), set(batch)
+
+    def route(self, cars, subscriptions, trims):
+        """(объявление, комплектация, получатели) для новых версий объявлений,
+        получатели — пары (чат, владелец подписки) и могут быть пустыми;
+        нераспознанные не помечаются просмотренными и переводят группу на
+        раздельные запросы."""
+        routed = []
+        for car in cars:
+            version = listing_version(car)
+            if version in self.seen:
+                continue
+            trim = badge_of(car, trims)
+            if trim is None:
+                if not self.split:
+                    self.split = True
+                    logger.info(
+                        "Комплектация не определена, опрос %s по отдельности",
+                        self.model,
+                        extra=fields(car_id=car["Id"]),
+                    )
+                continue
+            self.seen.add(version)
+            recipients = sorted(
+                {
+                    (s.chat_id, s.user_id)
+                    for s in subscriptions
+                    if s.trim == trim and s.matches(car)
+                }
+            )
+            routed.append((car, trim, recipients))
+        return routed
+
+
+class Tier(NamedTuple):
+    weight: float  # доля в бюджете опроса относительно обычного пользователя
+    interval: float  # не опрашивать группу чаще, секунды
+
+
+class TokenBucket:
+    """Глобальный бюджет запросов к прокси: rate токенов в секунду, запас на
+    burst запросов. rate 0 — без ограничения. Списывать можно и в долг:
+    следующий wait() дождётся, пока долг не погасится."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, tokens=1):
+        """Ждёт, пока в бюджете наберётся tokens токенов; возвращает время
+        ожидания."""
+        waited = 0.0
+        while self.rate:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    break
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+        return waited
+
+    def take(self, count):
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens -= count
+
+
+class PollScheduler:
+    """Группирует подписки по модели и опрашивает каталог в пределах общего
+    бюджета запросов к прокси. fetch(query, seen) -> (список новых объявлений
+    или None, commit); commit() вызывается, когда объявления записаны в
+    outbox и историю. history решает, о чём сообщать: новое объявление, снижение
+    цены, повторное размещение; уведомления уходят через outbox.
+
+    Бюджет делится между пользователями, а не между подписками: вес
+    пользователя по тарифу tier_of(user_id) поровну распределяется по его
+    группам, вес группы — сумма долей её пользователей. Очередь группы выбирается по start-time fair
+    queuing: у кого меньше метка начала, тот и опрашивается, а опрос
+    сдвигает метку на число запросов, делённое на вес. Чаще, чем позволяет
+    самый быстрый тариф среди чатов группы, группа не опрашивается.
+    """
+
+    def __init__(
+        self,
+        fetch,
+        outbox,
+        history,
+        seen,
+        tier_of,
+        budget_per_minute,
+        workers,
+    ):
+        self.fetch = fetch
+        self.outbox = outbox
+        self.history = history
+        self.seen = seen
+        self.tier_of = tier_of
+        # Запас бюджета — не больше секунды опросов
+        self.bucket = TokenBucket(
+            budget_per_minute / 60, max(1.0, budget_per_minute / 60)
+        )
+        self.groups = {}
+        # Чаты, которым доставка невозможна (бот заблокирован), и
+        # пользователи с отозванным доступом: их подписки не опрашиваются
+        # до resume(). Список хранится в базе outbox и переживает перезапуск
+        self.suspended = outbox.suspended()
+        self._virtual_time = 0.0
+        self._changed = threading.Condition()
+        self._free = threading.Semaphore(workers)
+        self._pool = BoundedWorkerPool("poll", workers, workers)
+        self._dispatcher = None
+        metrics.SUSPENDED_CHATS.set_function(lambda: len(self.suspended))
+        metrics.ACTIVE_POLLERS.set_function(lambda: len(self.groups))
+
+    def take_spare(self):
+        """Фоновый запрос к прокси вне опроса (обход каталога): ждёт, пока
+        бюджет заполнится, и списывает из него запрос. Пока опрос расходует
+        бюджет, запас не набирается, так что фон подписки не вытесняет."""
+        self.bucket.wait(self.bucket.burst)
+        self.bucket.take(1)
+
+    def suspend(self, chat_id, reason):
+        """chat_id — чат или пользователь: приостанавливаются подписки, которые
+        в него доставляются или которыми он владеет."""
+        with self._changed:
+            if chat_id in self.suspended:
+                return False
+            self.suspended.add(chat_id)
+        self.outbox.suspend(chat_id, reason)
+        logger.info(
+            "Подписки чата приостановлены: %s", reason, extra=fields(chat_id=chat_id)
+        )
+        return True
+
+    def is_suspended(self, chat_id):
+        return chat_id in self.suspended
+
+    def resume(self, chat_id):
+        with self._changed:
+            if chat_id not in self.suspended:
+                return False
+            self.suspended.discard(chat_id)
+            self._changed.notify_all()
+        self.outbox.resume(chat_id)
+        logger.info("Подписки чата возобновлены", extra=fields(chat_id=chat_id))
+        return True
+
+    @staticmethod
+    def _subscription(user_id, search):
+        key = (
+            search["manufacturer"].strip(),
+            search["model_group"].strip(),
+            model_code(search["model"].strip()),
+        )
+        subscription = Subscription(
+            int(search.get("chat_id", user_id)),
+            user_id,
+            search["trim"].strip(),
+            int(search["year_from"]),
+            int(search["year_to"]),
+            int(search["mileage_from"]),
+            int(search["mileage_to"]),
+        )
+        return key, subscription
+
+    def add(self, user_id, search):
+        """Подписка пользователя; уведомления уходят в search["chat_id"], а в
+        запросах, сохранённых без него, — в личку пользователя."""
+        key, subscription = self._subscription(user_id, search)
+        with self._changed:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = PollGroup(
+                    search["manufacturer"].strip(),
+                    search["model_group"].strip(),
+                    search["model"].strip(),
+                    self.seen,
+                )
+                group.finish = self._virtual_time
+            group.subscriptions[subscription] += 1
+            self._changed.notify_all()
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch, name="poll-dispatcher", daemon=True
+                )
+                self._dispatcher.start()
+        return group
+
+    def remove(self, user_id, search=None):
+        """Снимает одну подписку пользователя, а без search — все его подписки."""
+        with self._changed:
+            if search is not None:
+                key, subscription = self._subscription(user_id, search)
+                targets = {key: Counter([subscription])}
+            else:
+                targets = {
+                    key: Counter(
+                        {
+                            s: count
+                            for s, count in group.subscriptions.items()
+                            if s.user_id == user_id
+                        }
+                    )
+                    for key, group in self.groups.items()
+                }
+            for key, subscriptions in targets.items():
+                group = self.groups.get(key)
+                if group is None:
+                    continue
+                group.subscriptions -= subscriptions
+                if not group.subscriptions:
+                    del self.groups[key]
+
+    def _active(self, group):
+        return [
+            s
+            for s in group.subscriptions
+            if s.chat_id not in self.suspended and s.user_id not in self.suspended
+        ]
+
+    def _weights(self):
+        # Вес группы: сумма по пользователям tier.weight / число их активных
+        # групп
+        users = {}
+        for key, group in self.groups.items():
+            for user_id in {s.user_id for s in self._active(group)}:
+                users.setdefault(user_id, []).append(key)
+        weights = {}
+        for user_id, keys in users.items():
+            share = self.tier_of(user_id).weight / len(keys)
+            for key in keys:
+                weights[key] = weights.get(key, 0.0) + share
+        return weights
+
+    def _next(self):
+        """Группа для опроса или (None, сколько ждать). Вызывается под _changed."""
+        now = time.monotonic()
+        weights = self._weights()
+        best, wait = None, None
+        for key, weight in weights.items():
+            group = self.groups[key]
+            if group.running:
+                continue
+            interval = min(
+                self.tier_of(user_id).interval
+                for user_id in {s.user_id for s in self._active(group)}
+            )
+            due = group.polled + interval - now
+            if due > 0:
+                wait = due if wait is None else min(wait, due)
+                continue
+            start = max(self._virtual_time, group.finish)
+            if best is None or start < best[0]:
+                best = (start, group, weight)
+        if best is None:
+            return None, wait
+        start, group, weight = best
+        group.finish = start + group.cost / weight
+        self._virtual_time = start
+        return group, None
+
+    def _dispatch(self):
+        # Группа выбирается только когда есть и свободный исполнитель, и токен
+        # бюджета: тогда очередность опросов задаёт fair queuing, а не то, кто
+        # первым дождался токена
+        while True:
+            self._free.acquire()
+            group = None
+            try:
+                metrics.POLL_BUDGET_WAIT.observe(self.bucket.wait())
+                with self._changed:
+                    while True:
+                        group, wait = self._next()
+                        if group is not None:
+                            break
+                        self._changed.wait(wait)
+                    group.running = True
+                    self.bucket.take(group.cost)
+                self._pool.put(self._poll, group, group.cost)
+            except Exception as e:
+                logger.exception("Ошибка диспетчера опроса: %s", e)
+                if group is not None:
+                    with self._changed:
+                        group.running = False
+                self._free.release()
+                time.sleep(1)
+
+    def _poll(self, group, charged):
+        try:
+            with self._changed:
+                subscriptions = self._active(group)
+            queries = list(group.queries(subscriptions)) if subscriptions else []
+            # Группа могла перейти на раздельные запросы после прошлого опроса:
+            # недостающие запросы списываются из бюджета в долг
+            group.cost = max(1, len(queries))
+            self.bucket.take(group.cost - charged)
+            for query, trims in queries:
+                try:
+                    cars, commit = self.fetch(query, group.seen)
+                    if cars is None:
+                        continue
+                    routed = group.route(cars, subscriptions, trims)
+                    entries = [(car, trim) for car, trim, _ in routed]
+                    # Сначала outbox, потом история: упав между ними, опрос
+                    # повторится, а повторная запись в outbox не пройдёт
+                    changes = self.history.classify(entries)
+                    self.outbox.enqueue(
+                        [
+                            (car, recipients, change)
+                            for (car, _, recipients), change in zip(routed, changes)
+                            if change is not None and recipients
+                        ]
+                    )
+                    self.history.record(
+                        query_hash(query),
+                        (group.manufacturer, group.model_group, group.model),
+                        entries,
+                    )
+                    commit()
+                except Exception as e:
+                    logger.exception(
+                        "Общая ошибка при проверке новых авто: %s",
+                        e,
+                        extra=fields(query=query_hash(query)),
+                    )
+        finally:
+            with self._changed:
+                group.running = False
+                group.polled = time.monotonic()
+                self._changed.notify_all()
+            self._free.release()
@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+
+from config import STARTUP_BUDGET_MS
+from log import fields, get_logger
+
+logger = get_logger("startup")
+
+
+class StartupTimer:
+    """Замеряет время импортов и фаз инициализации до начала опроса Telegram."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def report(self):
+        total = self.elapsed_ms()
+        phases = {name: round(elapsed * 1000, 1) for name, elapsed in self.phases}
+        logger.info(
+            "Запуск занял %.0f мс: %s",
+            total,
+            ", ".join(f"{name} {ms:.0f} мс" for name, ms in phases.items()),
+            extra=fields(startup_ms=round(total, 1)),
+        )
+        if total > STARTUP_BUDGET_MS:
+            logger.warning(
+                "Превышен бюджет запуска %.0f мс на %.0f мс",
+                STARTUP_BUDGET_MS,
+                total - STARTUP_BUDGET_MS,
+            )
+
+
+# Создаётся при первом импорте модуля — main импортирует его раньше всего
+startup_timer = StartupTimer()
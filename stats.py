@@ -0,0 +1,144 @@
+"""Статистика рынка по истории объявлений без запросов к прокси.
+
+Из history собираются столбцы NumPy (цена, пробег, год, код модели), и
+каждый ответ — это маска и несколько векторных операций над ними. В
+столбцы попадают только объявления, которые были в выдаче за последние
+window секунд, — статистика отражает текущий рынок, а не всё, что бот
+когда-либо видел. Столбцы пересобираются не чаще раза в max_age секунд.
+
+NumPy импортируется при первом запросе статистики, а не при запуске бота.
+"""
+
+import threading
+import time
+from typing import NamedTuple
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class Columns(NamedTuple):
+    labels: dict  # (manufacturer, model_group, model, trim) -> код
+    codes: "np.ndarray"
+    price: "np.ndarray"
+    mileage: "np.ndarray"
+    year: "np.ndarray"
+
+
+class Summary(NamedTuple):
+    count: int
+    price: dict  # перцентиль -> цена, 만원
+    mileage: dict  # перцентиль -> пробег, км
+    median_price_by_year: dict  # год -> медианная цена, 만원
+
+
+def _year(value):
+    try:
+        return int(str(value)[:4])
+    except (TypeError, ValueError):
+        return 0
+
+
+def build_columns(rows):
+    """rows — строки ListingHistory.catalog_rows()."""
+    import numpy as np
+
+    codes_by_label = {}
+    codes = np.empty(len(rows), dtype=np.int32)
+    price = np.empty(len(rows), dtype=np.float64)
+    mileage = np.empty(len(rows), dtype=np.float64)
+    year = np.empty(len(rows), dtype=np.int32)
+    for i, (*label, car_price, car_mileage, form_year) in enumerate(rows):
+        codes[i] = codes_by_label.setdefault(tuple(label), len(codes_by_label))
+        price[i] = np.nan if car_price is None else car_price
+        mileage[i] = np.nan if car_mileage is None else car_mileage
+        year[i] = _year(form_year)
+    return Columns(codes_by_label, codes, price, mileage, year)
+
+
+def summarize(columns, mask):
+    import numpy as np
+
+    price = columns.price[mask]
+    mileage = columns.mileage[mask]
+    year = columns.year[mask]
+    priced = ~np.isnan(price)
+    price, year = price[priced], year[priced]
+    # Медиана по году без цикла: сортировка по (год, цена) и середина каждой
+    # группы; год 0 — неизвестен
+    order = np.lexsort((price, year))
+    price, year = price[order], year[order]
+    years, starts, counts = np.unique(year, return_index=True, return_counts=True)
+    medians = (price[starts + (counts - 1) // 2] + price[starts + counts // 2]) / 2
+    return Summary(
+        int(mask.sum()),
+        _percentiles(price),
+        _percentiles(mileage[~np.isnan(mileage)]),
+        {int(y): float(m) for y, m in zip(years, medians) if y},
+    )
+
+
+def _percentiles(values):
+    import numpy as np
+
+    if not len(values):
+        return {}
+    return dict(zip(PERCENTILES, np.percentile(values, PERCENTILES).tolist()))
+
+
+class MarketStats:
+    """Ответы /stats по истории объявлений ListingHistory."""
+
+    def __init__(self, history, max_age=60, window=30 * 86400):
+        self.history = history
+        self.max_age = max_age
+        self.window = window
+        self._columns = None
+        self._version = None
+        self._built = 0.0
+        self._lock = threading.Lock()
+
+    def columns(self):
+        with self._lock:
+            version = self.history.version
+            age = time.monotonic() - self._built
+            # Окно сдвигается и без новых записей: раз в час пересобираем всё равно
+            stale = age >= self.max_age and (version != self._version or age >= 3600)
+            if self._columns is None or stale:
+                self._columns = build_columns(
+                    self.history.catalog_rows(time.time() - self.window)
+                )
+                self._version = version
+                self._built = time.monotonic()
+            return self._columns
+
+    def for_request(self, search):
+        """Статистика по сохранённому запросу: модель, комплектация, годы и
+        пробег из запроса."""
+        columns = self.columns()
+        label = tuple(
+            search[field].strip()
+            for field in ("manufacturer", "model_group", "model", "trim")
+        )
+        code = columns.labels.get(label, -1)
+        mask = (
+            (columns.codes == code)
+            & (columns.year >= int(search["year_from"]))
+            & (columns.year <= int(search["year_to"]))
+            & (columns.mileage >= int(search["mileage_from"]))
+            & (columns.mileage <= int(search["mileage_to"]))
+        )
+        return summarize(columns, mask)
+
+    def search(self, text):
+        """Статистика по всем моделям, в названии которых (марка, модель,
+        поколение, комплектация) есть все слова из text."""
+        columns = self.columns()
+        words = text.lower().split()
+        matched = [
+            code
+            for label, code in columns.labels.items()
+            if all(word in " ".join(filter(None, label)).lower() for word in words)
+        ]
+        import numpy as np
+
+        return summarize(columns, np.isin(columns.codes, matched))
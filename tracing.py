@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from telebot.handler_backends import BaseMiddleware
+
+from config import TRACE_FILE, TRACE_FILE_BACKUPS, TRACE_FILE_MAX_BYTES, TRACE_SLOW_MS
+from log import file_logger
+
+_local = threading.local()
+_slow_traces = None
+_slow_traces_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.depth = 0
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self.started
+        if error is not None:
+            self.attributes["error"] = repr(error)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": round(self.duration * 1000, 1),
+            **self.attributes,
+            "spans": self.spans,
+        }
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def start_trace(name, **attributes):
+    trace = Trace(name, **attributes)
+    _local.trace = trace
+    return trace
+
+
+def finish_trace(error=None):
+    trace = current_trace()
+    if trace is None:
+        return None
+    _local.trace = None
+    trace.finish(error)
+    if trace.duration * 1000 >= TRACE_SLOW_MS:
+        _dump(trace)
+    return trace
+
+
+@contextmanager
+def span(name):
+    """Участок внутри текущей трассы; вне обработчика ничего не стоит."""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    trace.depth += 1
+    try:
+        yield
+    finally:
+        trace.depth -= 1
+        trace.spans.append(
+            {
+                "name": name,
+                "depth": trace.depth,
+                "start_ms": round((started - trace.started) * 1000, 1),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+        )
+
+
+def _dump(trace):
+    global _slow_traces
+    if _slow_traces is None:
+        # Медленные трассы пишутся из рабочих потоков: без блокировки два
+        # потока могли бы открыть по своему файловому обработчику.
+        with _slow_traces_lock:
+            if _slow_traces is None:
+                _slow_traces = file_logger(
+                    "traces", TRACE_FILE, TRACE_FILE_MAX_BYTES, TRACE_FILE_BACKUPS
+                )
+    _slow_traces.warning(json.dumps(trace.to_dict(), ensure_ascii=False))
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает трассу на каждый апдейт и закрывает её после обработчика.
+
+    Обработчики telebot выполняются в том же потоке, что и pre/post_process,
+    поэтому участки (span) внутри обработчика попадают в его трассу.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.update_types = ["message", "callback_query", "inline_query"]
+
+    def pre_process(self, update, data):
+        user = getattr(update, "from_user", None)
+        start_trace(self._name(update), user_id=user.id if user else None)
+
+    def post_process(self, update, data, exception):
+        finish_trace(exception)
+
+    @staticmethod
+    def _name(update):
+        callback = getattr(update, "data", None)
+        if callback is not None:
+            return f"callback:{callback.split(':', 1)[0]}"
+        if getattr(update, "query", None) is not None:
+            return "inline_query"
+        text = getattr(update, "text", None) or ""
+        if text.startswith("/"):
+            return f"command:{text.split()[0][1:]}"
+        return f"message:{getattr(update, 'content_type', '')}"
@@ -0,0 +1,98 @@
+import importlib.util
+import marshal
+import os
+import threading
+from functools import lru_cache
+
+from log import get_logger
+
+logger = get_logger("translator")
+
+# Пустая строка не может быть словом после split(), поэтому подходит как маркер
+# конца ключа и при этом сериализуется marshal'ом
+_END = ""
+TRIE_FORMAT = 1
+TRIE_CACHE_FILE = "translations.cache"
+
+
+def compile_trie(table):
+    trie = {}
+    for phrase, translation in table.items():
+        node = trie
+        for word in phrase.split():
+            node = node.setdefault(word, {})
+        node[_END] = translation
+    return trie
+
+
+def load_translation_trie(cache_path=TRIE_CACHE_FILE):
+    """Дерево переводов из скомпилированного кэша, а при его устаревании —
+    из translations.py с пересохранением кэша."""
+    source = importlib.util.find_spec("translations").origin
+    stat = os.stat(source)
+    signature = (TRIE_FORMAT, stat.st_mtime_ns, stat.st_size)
+
+    try:
+        with open(cache_path, "rb") as f:
+            cached_signature, trie = marshal.load(f)
+        if tuple(cached_signature) == signature:
+            return trie
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    from translations import translations
+
+    trie = compile_trie(translations)
+    try:
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump((signature, trie), f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning("Не удалось сохранить кэш переводов: %s", e)
+    return trie
+
+
+class PhraseTranslator:
+    """Переводит фразу по словарю переводов, выбирая самое длинное совпадение.
+
+    Ключи словаря разбиваются на слова и складываются в префиксное дерево,
+    поэтому многословные ключи ("시트 색상") переводятся целиком, а не по
+    отдельным словам. Дерево загружается при первом переводе, результат
+    для каждой входной фразы запоминается.
+    """
+
+    def __init__(self, loader=load_translation_trie, cache_size=8192):
+        self._loader = loader
+        self._trie = None
+        self._lock = threading.Lock()
+        self.translate = lru_cache(maxsize=cache_size)(self._translate)
+
+    def warm(self):
+        if self._trie is None:
+            with self._lock:
+                if self._trie is None:
+                    self._trie = self._loader()
+        return self._trie
+
+    def _translate(self, phrase):
+        trie = self.warm()
+        words = phrase.split()
+        translated = []
+        i = 0
+        while i < len(words):
+            node = trie
+            match = None
+            j = i
+            while j < len(words) and words[j] in node:
+                node = node[words[j]]
+                j += 1
+                if _END in node:
+                    match = (j, node[_END])
+            if match:
+                i, translation = match
+                translated.append(translation)
+            else:
+                translated.append(words[i])
+                i += 1
+        return " ".join(translated)
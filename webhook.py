@@ -0,0 +1,106 @@
+import hmac
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+import metrics
+from capture import capture
+from log import get_logger
+
+logger = get_logger("webhook")
+
+# Telegram присылает обновления размером в единицы килобайт
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class WebhookServer:
+    """Принимает обновления от Telegram по HTTP и кладёт их в ограниченную
+    очередь; обработчики запускаются в пуле из `workers` потоков. Ответ
+    Telegram отдаётся сразу после постановки в очередь, при переполнении —
+    503, и Telegram повторит доставку позже."""
+
+    def __init__(self, bot, path, secret, workers=8, queue_size=1000):
+        self.bot = bot
+        self.path = path
+        self.secret = secret.encode("utf-8")
+        self.workers = workers
+        self.updates = queue.Queue(queue_size)
+        self._server = None
+        metrics.WEBHOOK_QUEUE.set_function(self.updates.qsize)
+
+    def start(self, host, port):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_BYTES:
+                    # Тело не читаем, поэтому соединение дальше использовать нельзя
+                    status = webhook._reject(413, "size")
+                    self.close_connection = True
+                else:
+                    status = webhook.accept(
+                        self.path,
+                        self.headers.get("X-Telegram-Bot-Api-Secret-Token", ""),
+                        self.rfile.read(length),
+                    )
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        for i in range(self.workers):
+            threading.Thread(
+                target=self._work, name=f"webhook-{i}", daemon=True
+            ).start()
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="webhook", daemon=True
+        ).start()
+        logger.info("Вебхук слушает %s:%d%s", host, port, self.path)
+        return self._server
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def accept(self, path, secret, body):
+        if path != self.path:
+            return self._reject(404, "path")
+        if not hmac.compare_digest(secret.encode("utf-8"), self.secret):
+            return self._reject(403, "secret")
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return self._reject(400, "json")
+        try:
+            self.updates.put_nowait(update)
+        except queue.Full:
+            return self._reject(503, "overflow")
+        metrics.WEBHOOK_UPDATES.labels("accepted").inc()
+        return 200
+
+    @staticmethod
+    def _reject(status, reason):
+        metrics.WEBHOOK_UPDATES.labels(reason).inc()
+        if status != 503:
+            logger.warning("Вебхук отклонил запрос: %s", reason)
+        return status
+
+    def _work(self):
+        while True:
+            update = self.updates.get()
+            try:
+                capture.record_update(update)
+                self.bot.process_new_updates([types.Update.de_json(update)])
+            except Exception:
+                logger.exception("Ошибка обработки обновления из вебхука")
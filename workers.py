@@ -0,0 +1,84 @@
+import queue
+import threading
+import time
+
+import metrics
+from log import get_logger
+from tracing import finish_trace, start_trace
+
+logger = get_logger("workers")
+
+
+class BoundedWorkerPool:
+    """Пул потоков с ограниченной очередью. Совместим с bot.worker_pool:
+    telebot кладёт задачи через put(). Когда очередь полна, задача не ставится,
+    а вызывается on_reject(func, args, kwargs) — например, ответ «бот занят».
+
+    Исключения задач логируются и не перезапускают опрос Telegram, как это
+    делает стандартный пул telebot.
+    """
+
+    def __init__(self, name, workers, queue_size, on_reject=None, trace=False):
+        self.name = name
+        self.tasks = queue.Queue(queue_size)
+        self.on_reject = on_reject
+        self.trace = trace
+        self.busy = 0
+        self.exception_event = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, func, *args, **kwargs):
+        try:
+            self.tasks.put_nowait((func, args, kwargs, time.perf_counter()))
+        except queue.Full:
+            metrics.WORKER_REJECTED.labels(self.name).inc()
+            logger.warning("Очередь пула %s переполнена, задача отклонена", self.name)
+            if self.on_reject is not None:
+                self.on_reject(func, args, kwargs)
+            return False
+        metrics.WORKER_QUEUE.labels(self.name).set(self.tasks.qsize())
+        return True
+
+    def _work(self):
+        while (task := self.tasks.get()) is not None:
+            func, args, kwargs, queued = task
+            metrics.WORKER_QUEUE.labels(self.name).set(self.tasks.qsize())
+            metrics.WORKER_WAIT.labels(self.name).observe(time.perf_counter() - queued)
+            self._set_busy(1)
+            if self.trace:
+                start_trace(f"{self.name}:{getattr(func, '__name__', 'task')}")
+            error = None
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                error = e
+                logger.exception("Ошибка в задаче пула %s", self.name)
+            finally:
+                if self.trace:
+                    finish_trace(error)
+                self._set_busy(-1)
+
+    def _set_busy(self, delta):
+        with self._lock:
+            self.busy += delta
+            metrics.WORKER_BUSY.labels(self.name).set(self.busy)
+
+    # Интерфейс telebot.util.ThreadPool
+    def raise_exceptions(self):
+        pass
+
+    def clear_exceptions(self):
+        self.exception_event.clear()
+
+    def close(self):
+        for _ in self._threads:
+            self.tasks.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()